@@ -96,41 +96,33 @@ EXTRA_ARGS=( "$@" )
 #  EXTRA_ARGS=()
 #fi
 
-# Function for data and bkg modes
+# Function for data and bkg modes: all samples share one cluster in a single run_analysis.py call
 run_analysis() {
   local era="$1"
-  local process="$2"
-#  echo "Running analysis for era ${era} and --process ${process}"
-  python3 bin/run_analysis.py "${era}" "${process}" "${EXTRA_ARGS[@]}" || {
-    echo "Error running analysis for process ${process} with era ${era}. Skipping..."
+  shift
+  python3 bin/run_analysis.py "${era}" "$@" "${EXTRA_ARGS[@]}" || {
+    echo "Error running analysis for processes $* with era ${era}."
     return 1
   }
 }
 
-# Function for signal mode (with mass option)
+# Function for signal mode: all mass points are processed in a single run_analysis.py call
 run_signal_analysis() {
   local era="$1"
-  local mass="$2"
-#  echo "Running analysis for era ${era} and signal with --mass ${mass}"
-  python3 bin/run_analysis.py "${era}" "Signal" --mass "${mass}" "${EXTRA_ARGS[@]}" || {
-    echo "Error running signal analysis for mass ${mass} with era ${era}. Skipping..."
+  local masses="$2"
+  python3 bin/run_analysis.py "${era}" "Signal" --mass "${masses}" "${EXTRA_ARGS[@]}" || {
+    echo "Error running signal analysis with era ${era}."
     return 1
   }
 }
 
 # Run analysis based on mode
 if [ "${MODE}" == "data" ]; then
-  for process in "${DATA_OPTIONS[@]}"; do
-    run_analysis "${SELECTED_ERA}" "${process}"
-  done
+  run_analysis "${SELECTED_ERA}" "${DATA_OPTIONS[@]}"
 elif [ "${MODE}" == "bkg" ]; then
-  for process in "${MC_OPTIONS[@]}"; do
-    run_analysis "${SELECTED_ERA}" "${process}"
-  done
+  run_analysis "${SELECTED_ERA}" "${MC_OPTIONS[@]}"
 elif [ "${MODE}" == "signal" ]; then
-  for mass in "${MASS_OPTIONS[@]}"; do
-    run_signal_analysis "${SELECTED_ERA}" "${mass}"
-  done
+  run_signal_analysis "${SELECTED_ERA}" "$(IFS=,; echo "${MASS_OPTIONS[*]}")"
 fi
 
 echo "All analyses complete!"
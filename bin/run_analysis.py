@@ -6,13 +6,18 @@ import time
 import json
 import logging
 import csv
+import re
+from contextlib import nullcontext
+from dataclasses import replace
+from itertools import chain, zip_longest
 from pathlib import Path
 from coffea.nanoevents import NanoAODSchema
 import sys
 import os
 
 from dask.distributed import Client, LocalCluster
-from coffea.processor import Runner, DaskExecutor
+from distributed.diagnostics.plugin import WorkerPlugin
+from coffea.processor import Runner, DaskExecutor, FuturesExecutor, IterativeExecutor, accumulate
 from coffea.nanoevents import NanoEventsFactory, NanoAODSchema
 from coffea.processor import ProcessorABC
 
@@ -22,15 +27,29 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../pyth
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from analyzer import WrAnalysis
+from regions import DEFAULT_REGIONS_FILE
+from chunk_cache import ChunkStore, CachingProcessor, code_hash, chunk_key, dataset_hashes
+from chunk_tuning import CalibrationProcessor, choose_chunksize
+from chunk_metrics import MetricsProcessor
+from compact_output import CODECS, CompactOutputProcessor, unpack_output
 import uproot
-from python.save_hists import save_histograms
-from python.preprocess_utils import get_era_details, load_json
+from python.save_hists import save_histograms, save_cutflow
+from python.preprocess_utils import get_era_details, load_json, check_columns
+from python.metadata_cache import PersistentMetadataCache, DEFAULT_METADATA_CACHE, DEFAULT_MAX_AGE
+from python.save_hists import get_output_file
+from python.metrics import WorkerSampler, build_report, save_report, default_report_path
+from python.scaling import ScalingPolicy, Autoscaler
+from python.incremental import load_manifest, save_manifest, prune_fileset, removed_files, is_covered, record_chunks, record_outputs, output_problems, dataset_records, record_datasets
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 NanoAODSchema.warn_missing_crossrefs = False
 NanoAODSchema.error_missing_event_ids = False
 
+MC_SAMPLES = ["DYJets", "TTbar", "TW", "WJets", "SingleTop", "TTbarSemileptonic", "TTV", "Diboson", "Triboson"]
+DATA_SAMPLES = ["EGamma", "Muon"]
+SAMPLE_GROUPS = {"bkg": MC_SAMPLES, "data": DATA_SAMPLES}
+
 def load_masses_from_csv(file_path):
     mass_choices = []
     try:
@@ -51,27 +70,224 @@ def load_masses_from_csv(file_path):
         raise
     return mass_choices
 
-def filter_by_process(fileset, desired_process, mass=None):
+def signal_mass_point(sample):
+    """
+    Mass point of a signal sample name, e.g. WRtoNEltoElElJJ_MWR2000_N100_TuneCP5... -> WR2000_N100.
+    Matching the full point avoids WR2000_N100 also selecting WR2000_N1000.
+    """
+    match = re.search(r"WR(\d+)_N(\d+)(?!\d)", sample)
+    return f"WR{match.group(1)}_N{match.group(2)}" if match else None
+
+def parse_masses(mass_arg, sig_points):
+    """
+    Turn the --mass argument (a single point, a comma-separated list of points, or 'all') into a list of points.
+    """
+    if not mass_arg:
+        return []
+    if mass_arg == "all":
+        return list(sig_points)
+    return [mass.strip() for mass in mass_arg.split(",") if mass.strip()]
+
+def filter_by_process(fileset, desired_process, masses=None):
     if desired_process == "Signal":
-        return {ds: data for ds, data in fileset.items() if mass in data['metadata']['sample']}
+        return {ds: data for ds, data in fileset.items() if signal_mass_point(data['metadata']['sample']) in masses}
     else:
         return {ds: data for ds, data in fileset.items() if data['metadata']['physics_group'] == desired_process}
 
+def expand_samples(samples):
+    """
+    Expand 'bkg' and 'data' into their samples, keeping the order and dropping duplicates.
+    """
+    expanded = chain.from_iterable(SAMPLE_GROUPS.get(sample, [sample]) for sample in samples)
+    return list(dict.fromkeys(expanded))
+
+def get_fileset_path(era, sample, unskimmed):
+    run, year, era_name = get_era_details(era)
+    subdir = "unskimmed" if unskimmed else "skimmed"
+
+    if sample in DATA_SAMPLES:
+        filename = f"{era_name}_{sample}_fileset.json" if unskimmed else f"{era_name}_data_skimmed_fileset.json"
+    elif sample == "Signal":
+        filename = f"{era_name}_{sample}_fileset.json" if unskimmed else f"{era_name}_signal_skimmed_fileset.json"
+    else:
+        filename = f"{era_name}_{sample}_fileset.json" if unskimmed else f"{era_name}_mc_lo_dy_skimmed_fileset.json"
+
+    return Path("data/jsons") / run / year / era_name / subdir / filename
+
+def interleave_chunks(chunks):
+    """
+    Round-robin the work items of all datasets, so small samples are processed alongside
+    a large one instead of queuing behind all of its chunks.
+    """
+    by_dataset = {}
+    for chunk in chunks:
+        by_dataset.setdefault(chunk.dataset, []).append(chunk)
+    return [chunk for group in zip_longest(*by_dataset.values()) for chunk in group if chunk is not None]
+
+def output_group(args, metadata):
+    """
+    Output file a dataset is saved to: its mass point for signal, its physics group otherwise.
+    """
+    return signal_mass_point(metadata['sample']) if args.sample == "Signal" else metadata['physics_group']
+
+def group_args(args, group):
+    """
+    Arguments of a single output file, so get_output_file/save_histograms see one sample or mass point.
+    """
+    key = "mass" if args.sample == "Signal" else "sample"
+    return argparse.Namespace(**{**vars(args), key: group})
+
+def output_files(args, group):
+    """The ROOT and cutflow files of one output group, described by its manifest."""
+    return [get_output_file(group_args(args, group)), get_output_file(group_args(args, group), suffix="_cutflow.json")]
+
+def split_outputs(args, histograms, fileset):
+    """
+    Split the output of a run over several samples or mass points per output file; datasets are keyed by sample name.
+    """
+    groups = {data['metadata']['sample']: output_group(args, data['metadata']) for data in fileset.values()}
+    split = {}
+    for dataset, output in histograms.items():
+        split.setdefault(groups[dataset], {})[dataset] = output
+    return split
+
+# WrAnalysis arguments that change the histograms; the others only change how they are made
+HISTOGRAM_OPTIONS = ("lumi_eras", "regions_file")
+
+def make_analyzer_config(args):
+    """Arguments of WrAnalysis for this run."""
+    lumi_eras = [args.era] if any(sample in DATA_SAMPLES for sample in args.samples) else []
+    return {
+        "mass_point": args.masses[0] if len(args.masses) == 1 else None,
+        "lumi_eras": lumi_eras,
+        "preload": args.preload,
+        "regions_file": args.regions,
+        "profile_stages": args.profile_stages,
+    }
+
+def analyzer_hash(args, config):
+    """Hash of the analyzer source files, the regions file and config."""
+    src_dir = Path(__file__).resolve().parent.parent / "src"
+    return code_hash(list(src_dir.glob("*.py")) + [args.regions or DEFAULT_REGIONS_FILE], config=config)
+
+def split_cached_chunks(chunks, store, analyzer_hashes):
+    """
+    Separate the chunks whose output is already in the chunk store from those that must be processed.
+    Returns the chunks to process and the merged output of the cached ones.
+    """
+    to_process = []
+    cached_output = {}
+    n_cached = 0
+    for chunk in chunks:
+        output = store.get(chunk_key(chunk.fileuuid, chunk.entrystart, chunk.entrystop, analyzer_hashes[chunk.dataset]))
+        if output is None:
+            to_process.append(chunk)
+        else:
+            # Merged in place: accumulate([cached_output, output]) would copy the running total for every chunk
+            accumulate([output], cached_output)
+            n_cached += 1
+    logging.info(f"Chunk cache: {n_cached} chunks reused, {len(to_process)} to process")
+    return to_process, cached_output
+
+def expected_depth(n_outputs, fanin):
+    """
+    Number of merge levels a reduction tree of n_outputs chunk outputs in batches of fanin has.
+    Without a fan-in (iterative executor) outputs are merged one by one as they arrive.
+    """
+    if n_outputs <= 1:
+        return 0
+    if not fanin:
+        return n_outputs - 1
+    depth = 0
+    while n_outputs > 1:
+        n_outputs = -(-n_outputs // fanin)
+        depth += 1
+    return depth
+
+def calibrate_chunksizes(run, fileset, processor_instance, args):
+    """
+    Process a few small chunks of every dataset and pick a chunk size per dataset that hits
+    the target task duration without exceeding the memory ceiling. Datasets whose calibration
+    gives no usable measurement keep the default chunk size.
+    """
+    calibration_run = replace(run, chunksize=args.calibration_chunksize, maxchunks=args.calibration_chunks)
+    output, _ = calibration_run(fileset, treename="Events", processor_instance=CalibrationProcessor(processor_instance))
+
+    chunksizes = {}
+    for dataset in fileset:
+        measured = output.get("calibration", {}).get(dataset)
+        chunksize = choose_chunksize(measured, args.target_chunk_seconds, args.max_chunk_memory * 1024**3) if measured else None
+        chunksizes[dataset] = chunksize or run.chunksize
+        logging.info(f"Chunk size for {dataset}: {chunksizes[dataset]}")
+    return chunksizes
+
+class AddPaths(WorkerPlugin):
+    """Put the shipped src/ and python/ directories on the path of every Condor worker."""
+    def setup(self, worker):
+        for p in ("src", "python"):
+            if os.path.isdir(p) and p not in sys.path:
+                sys.path.insert(0, p)
+
+def available_cores():
+    """Cores this process may run on (respects taskset and cgroup CPU affinity)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def set_executor_defaults(args):
+    """
+    Fill in the executor settings: every available core gets a single-threaded worker,
+    since the analyzer holds the GIL for most of a chunk. Condor clusters are autoscaled
+    unless a fixed number of workers is given.
+    """
+    if args.condor:
+        args.autoscale = args.workers is None
+        args.max_workers = args.max_workers or 200
+        logging.info("Executor: condor with " + ("an autoscaled cluster" if args.autoscale else f"{args.workers} workers"))
+        return
+    if args.autoscale and args.executor != "dask":
+        logging.error("--autoscale needs --executor dask (or --condor).")
+        raise ValueError("Autoscaling without Dask.")
+    args.max_workers = args.max_workers or available_cores()
+    if args.executor == "iterative":
+        args.workers = 1
+    elif args.workers is None:
+        args.workers = max(available_cores() // args.threads_per_worker, 1)
+    if args.threads_per_worker != 1 and args.executor != "dask":
+        logging.warning("--threads-per-worker only applies to --executor dask; ignoring it.")
+    if args.autoscale:
+        logging.info(f"Executor: dask, autoscaled between {args.min_workers} and {args.max_workers} workers")
+    else:
+        logging.info(f"Executor: {args.executor} with {args.workers} workers")
+
 def validate_arguments(args, sig_points):
+    if "Signal" in args.samples and len(args.samples) > 1:
+        logging.error("'Signal' cannot be combined with other samples; use --mass to run several signal points.")
+        raise ValueError("Signal combined with other samples.")
     if args.sample == "Signal" and not args.mass:
         logging.error("For 'Signal', you must provide a --mass argument (e.g. --mass WR2000_N1900).")
         raise ValueError("Missing mass argument for Signal sample.")
-    if args.sample == "Signal" and args.mass not in sig_points:
-        logging.error(f"The provided signal point {args.mass} is not valid. Choose from {sig_points}.")
+    invalid = [mass for mass in args.masses if mass not in sig_points]
+    if args.sample == "Signal" and invalid:
+        logging.error(f"The provided signal points {invalid} are not valid. Choose from {sig_points}.")
         raise ValueError("Invalid mass argument for Signal sample.")
     if args.sample != "Signal" and args.mass:
         logging.error("The --mass option is only valid for 'Signal' samples.")
         raise ValueError("Mass argument provided for non-signal sample.")
-    if args.reweight and args.sample != "DYJets":
+    if args.reduction_fanin < 2:
+        logging.error("--reduction-fanin must be at least 2.")
+        raise ValueError("Invalid reduction fan-in.")
+    if args.reweight and args.samples != ["DYJets"]:
         logging.error("Reweighting can only be applied to DY")
         raise ValueError("Invalid sample for reweighting.")
 
-def run_analysis(args, filtered_fileset, run_on_condor):
+def run_analysis(args, filtered_fileset, run_on_condor, chunk_filter=None):
+
+    policy = None
+    if args.autoscale:
+        policy = ScalingPolicy(args.min_workers, args.max_workers, args.target_runtime)
+        n_files = sum(len(data['files']) for data in filtered_fileset.values())
 
     if run_on_condor:
         from lpcjobqueue import LPCCondorCluster
@@ -85,35 +301,45 @@ def run_analysis(args, filtered_fileset, run_on_condor):
                 str(repo_root / "src"),
                 str(repo_root / "python"),
                 str(repo_root / "bin"),
-                str(repo_root / "data" / "lumis"),
             ],
             log_directory=log_dir,
         )
 
-        NWORKERS = 20  # set what you want (1-4 is a good start)
+        # A fixed --workers, or enough workers to preprocess the files until the autoscaler sizes the cluster from the chunks
+        NWORKERS = args.workers or policy.preprocessing(n_files)
         cluster.scale(NWORKERS)
 
         client = Client(cluster)
         client.wait_for_workers(NWORKERS, timeout="180s")
 
-    #    cluster.adapt(minimum=1, maximum=200)
+        # As a plugin, so workers started later by the autoscaler get the paths too
+        client.register_plugin(AddPaths())
 
-        def _add_paths():
-            import sys, os
-            for p in ("src", "python"):
-                if os.path.isdir(p) and p not in sys.path:
-                    sys.path.insert(0, p)
-            return sys.path
+    elif args.executor == "dask":
+        # Fixed size, so every worker is up before the first chunk instead of ramping up with adapt()
+        cluster = LocalCluster(n_workers=policy.preprocessing(n_files) if policy else args.workers, threads_per_worker=args.threads_per_worker)
+        client = Client(cluster)
+
+    else:
+        cluster = client = None
 
-        client.run(_add_paths)
+    # File entry counts and UUIDs from earlier runs; only new or changed files are opened
+    metadata_cache = None
+    if not args.no_metadata_cache:
+        metadata_cache = PersistentMetadataCache(args.metadata_cache, max_age=args.metadata_cache_max_age * 3600)
+        metadata_cache.prefetch(f for data in filtered_fileset.values() for f in data['files'])
 
+    if client is not None:
+        # Chunk outputs are merged on the workers in batches of fan-in outputs, level by level
+        executor = DaskExecutor(client=client, compression=None, treereduction=args.reduction_fanin)
+    elif args.executor == "futures":
+        # Merge batches of finished outputs in the pool instead of one by one in this process
+        executor = FuturesExecutor(workers=args.workers, compression=None, merging=(args.workers, 2, args.reduction_fanin))
     else:
-        cluster = LocalCluster(n_workers=1, threads_per_worker=1)
-        cluster.adapt(minimum=1, maximum=10)
-        client = Client(cluster)
+        executor = IterativeExecutor()
 
     run = Runner(
-        executor = DaskExecutor(client=client, compression=None),
+        executor = executor,
         chunksize=250_000,
         maxchunks = None,
         skipbadfiles=False,
@@ -121,70 +347,227 @@ def run_analysis(args, filtered_fileset, run_on_condor):
         align_clusters = False,
         savemetrics=True,
         schema=NanoAODSchema,
+        metadata_cache=metadata_cache,
     )
 
     try:
+        analyzer_config = make_analyzer_config(args)
+        processor_instance = WrAnalysis(**analyzer_config)
+
         logging.info("***PREPROCESSING***")
-        preproc = run.preprocess(fileset=filtered_fileset, treename="Events")
+        chunksizes = {}
+        if args.auto_chunksize:
+            chunksizes = calibrate_chunksizes(run, filtered_fileset, processor_instance, args)
+            preproc = chain.from_iterable(
+                replace(run, chunksize=chunksizes[ds]).preprocess(fileset={ds: data}, treename="Events")
+                for ds, data in filtered_fileset.items()
+            )
+        else:
+            preproc = run.preprocess(fileset=filtered_fileset, treename="Events")
+        if chunk_filter is not None:
+            preproc = [chunk for chunk in preproc if chunk_filter(chunk)]
+        if len(args.samples) > 1:
+            preproc = interleave_chunks(preproc)
+        preproc = chunks = list(preproc)
         logging.info("Preprocessing completed")
+        if isinstance(run.executor, FuturesExecutor) and len(chunks) < run.executor.workers:
+            # No point in starting more processes than there are chunks
+            run = replace(run, executor=replace(run.executor, workers=max(len(chunks), 1)))
+
+        cached_output = {}
+        store = None
+        if args.chunk_cache:
+            # Chunks are reused only while the analyzer code, its configuration and the dataset metadata are unchanged
+            config = {**analyzer_config, "masses": args.masses, "reweight": args.reweight}
+            analyzer_hashes = dataset_hashes(analyzer_hash(args, config), filtered_fileset)
+            store = ChunkStore(args.chunk_cache, max_bytes=int(args.chunk_cache_size * 1024**3))
+            preproc, cached_output = split_cached_chunks(preproc, store, analyzer_hashes)
+            processor_instance = CachingProcessor(processor_instance, store, analyzer_hashes)
+
+        autoscaler = None
+        if policy is not None and preproc:
+            # The policy only takes over once the chunks are known
+            autoscaler = Autoscaler(cluster, client, policy, seconds_per_chunk=args.target_chunk_seconds)
+            autoscaler.scale(policy.initial(len(preproc), autoscaler.seconds_per_chunk))
 
         logging.info("***PROCESSING***")
-        histograms, metrics = run(
-            preproc,
-            treename="Events",
-            processor_instance=WrAnalysis(mass_point=args.mass),
-        )
+        histograms, metrics = {}, {}
+        t_start = time.monotonic()
+        run_start = time.time()
+        worker_processor = MetricsProcessor(processor_instance)
+        if args.compact_transfer:
+            worker_processor = CompactOutputProcessor(worker_processor, args.compact_transfer)
+        with (WorkerSampler(client) if client is not None else nullcontext()) as sampler, (autoscaler or nullcontext()):
+            if preproc:
+                histograms, metrics = run(
+                    preproc,
+                    treename="Events",
+                    processor_instance=worker_processor,
+                )
         logging.info("Processing completed")
-        return histograms
+        if store is not None:
+            store.evict()
+        histograms, transfer = unpack_output(histograms)
+        if transfer is not None:
+            metrics["transfer"] = transfer
+            logging.info(f"Transferred {transfer['messages']} outputs, {transfer['bytes'] / 1e6:.1f} MB "
+                         f"({transfer['raw_bytes'] / 1e6:.1f} MB of bins before compression, "
+                         f"{transfer['dropped_histograms']} empty histograms dropped)")
+        metrics["wall_time"] = time.monotonic() - t_start
+        # Wall-clock bounds of the Runner call, to place the chunk records (startup, merge tail)
+        metrics["run_start"] = run_start
+        metrics["run_end"] = time.time()
+        metrics["executor"] = "condor" if run_on_condor else args.executor
+        metrics["workers"] = sampler.samples if sampler is not None else [(0.0, getattr(run.executor, "workers", 1))]
+        if autoscaler is not None:
+            metrics["scaling"] = autoscaler.history
+        metrics["chunk_metrics"] = histograms.pop("chunk_metrics", [])
+        metrics["stage_timing"] = {
+            dataset: output.pop("stage_timing") for dataset, output in histograms.items() if "stage_timing" in output
+        }
+        for dataset, timings in metrics["stage_timing"].items():
+            total = sum(timings.values())
+            logging.info(f"Stage timing for {dataset}: " + ", ".join(f"{stage} {seconds:.1f}s ({seconds / total:.0%})" for stage, seconds in timings.items()))
+        fanin = None if args.executor == "iterative" and not run_on_condor else args.reduction_fanin
+        # Chunks submitted to the Runner, i.e. without those served by the chunk cache
+        metrics["reduction"] = {"fanin": fanin, "expected_depth": expected_depth(len(preproc), fanin)}
+        metrics["chunksize"] = chunksizes or {ds: run.chunksize for ds in filtered_fileset}
+        return (accumulate([histograms, cached_output]) if cached_output else histograms), metrics, chunks
     finally:
-        try:
-            client.close()
-        finally:
-            cluster.close()
+        if metadata_cache is not None:
+            metadata_cache.save()
+        if client is not None:
+            try:
+                client.close()
+            finally:
+                cluster.close()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Processing script for WR analysis.")
     parser.add_argument("era", type=str, choices=["RunIISummer20UL18", "Run3Summer22", "Run3Summer22EE"], help="Campaign to analyze.")
-    parser.add_argument("sample", type=str, choices=["DYJets", "TTbar", "TW", "WJets", "SingleTop", "TTbarSemileptonic", "TTV", "Diboson", "Triboson", "EGamma", "Muon", "Signal"], help="MC sample to analyze (e.g., Signal, DYJets).")
+    parser.add_argument("sample", type=str, nargs="+", choices=MC_SAMPLES + DATA_SAMPLES + ["Signal"] + list(SAMPLE_GROUPS), help="Sample(s) to analyze (e.g., Signal, DYJets). Several samples, or 'bkg' / 'data' for all of them, run on one cluster.")
     optional = parser.add_argument_group("Optional arguments")
-    optional.add_argument("--mass", type=str, default=None, help="Signal mass point to analyze.")
+    optional.add_argument("--mass", type=str, default=None, help="Signal mass point(s) to analyze: one point, a comma-separated list, or 'all' for every point in data/<era>_mass_points.csv.")
     optional.add_argument("--dir", type=str, default=None, help="Create a new output directory.")
     optional.add_argument("--name", type=str, default=None, help="Append the filenames of the output ROOT files.")
     optional.add_argument("--debug", action='store_true', help="Debug mode (don't compute histograms)")
     optional.add_argument("--reweight", type=str, default=None, help="Path to json file of DY reweights")
     optional.add_argument("--unskimmed", action='store_true', help="Run on unskimmed files.")
     optional.add_argument("--condor", action='store_true', help="Run on condor.")
+    optional.add_argument("--executor", type=str, choices=["iterative", "futures", "dask"], default="futures", help="Local executor (ignored with --condor): iterative (one process), futures (process pool) or dask (LocalCluster).")
+    optional.add_argument("--workers", type=int, default=None, help="Number of local worker processes (default: one per available core).")
+    optional.add_argument("--threads-per-worker", type=int, default=1, help="Threads per Dask worker with --executor dask.")
+    optional.add_argument("--autoscale", action='store_true', help="Size the local Dask cluster from the task backlog (always on with --condor unless --workers is given).")
+    optional.add_argument("--min-workers", type=int, default=1, help="Smallest number of workers of an autoscaled cluster.")
+    optional.add_argument("--max-workers", type=int, default=None, help="Largest number of workers of an autoscaled cluster (default: 200 on Condor, the available cores locally).")
+    optional.add_argument("--target-runtime", type=float, default=1800, help="Processing time in seconds an autoscaled cluster is sized for.")
+    optional.add_argument("--reduction-fanin", type=int, default=20, help="Number of chunk outputs merged together on the workers at each level of the reduction tree.")
+    optional.add_argument("--compact-transfer", type=str, choices=CODECS, default=None, help="Send chunk outputs in a compact format: empty histograms dropped and bin buffers compressed with this codec.")
+    optional.add_argument("--fileset", type=str, default=None, help="Fileset JSON to read instead of the default one of the era and sample (e.g. a synthetic fileset).")
+    optional.add_argument("--regions", type=str, default=None, help="JSON file of analysis regions (default: data/regions.json).")
+    optional.add_argument("--metadata-cache", type=str, default=str(DEFAULT_METADATA_CACHE), help="On-disk cache of preprocessing results (entry counts and file UUIDs).")
+    optional.add_argument("--metadata-cache-max-age", type=float, default=DEFAULT_MAX_AGE / 3600, help="Hours for which cache entries of files that cannot be stat'ed (e.g. no XRootD bindings) are trusted.")
+    optional.add_argument("--no-metadata-cache", action='store_true', help="Preprocess every file again without reading or writing the cache.")
+    optional.add_argument("--chunk-cache", type=str, default=None, help="Directory in which to store the output of every chunk and reuse it on later runs with unchanged analyzer code.")
+    optional.add_argument("--chunk-cache-size", type=float, default=20, help="Size budget of the chunk cache in GB; least recently used chunks are evicted beyond it.")
+    optional.add_argument("--incremental", action='store_true', help="Only process files and entry ranges not yet in the saved output, and merge the result into it.")
+    optional.add_argument("--auto-chunksize", action='store_true', help="Pick the chunk size of every dataset from a few calibration chunks.")
+    optional.add_argument("--target-chunk-seconds", type=float, default=60, help="Target processing time of one chunk with --auto-chunksize.")
+    optional.add_argument("--max-chunk-memory", type=float, default=2, help="Memory ceiling in GB of one chunk with --auto-chunksize.")
+    optional.add_argument("--calibration-chunksize", type=int, default=20_000, help="Size of the calibration chunks with --auto-chunksize.")
+    optional.add_argument("--calibration-chunks", type=int, default=2, help="Number of calibration chunks per dataset with --auto-chunksize.")
+    optional.add_argument("--metrics-report", type=str, default=None, help="Path of the JSON performance report (default: metrics/<era>_<samples>_<time>.json).")
+    optional.add_argument("--profile-stages", action='store_true', help="Time each stage of WrAnalysis.process and add the timings to the metrics report.")
+    optional.add_argument("--preload", action='store_true', help="Read all analyzer columns of a chunk in one coalesced uproot call.")
     args = parser.parse_args()
 
     signal_points = Path(f'data/{args.era}_mass_points.csv')
     MASS_CHOICES = load_masses_from_csv(signal_points)
+    args.masses = parse_masses(args.mass, MASS_CHOICES)
+
+    args.samples = expand_samples(args.sample)
+    args.sample = args.samples[0] if len(args.samples) == 1 else None
 
     print()
-    logging.info(f"Analyzing {args.era} - {args.sample} events")
+    logging.info(f"Analyzing {args.era} - {', '.join(args.samples)} events")
     
     validate_arguments(args, MASS_CHOICES)
-    run, year, era = get_era_details(args.era)
+    set_executor_defaults(args)
 
-    subdir = "unskimmed" if args.unskimmed else "skimmed"
+    filesets = {}
+    filtered_fileset = {}
+    for sample in args.samples:
+        filepath = Path(args.fileset) if args.fileset else get_fileset_path(args.era, sample, args.unskimmed)
+        if filepath not in filesets:
+            logging.info(f"Reading files from {filepath}")
+            filesets[filepath] = load_json(str(filepath))
+        sample_fileset = filter_by_process(filesets[filepath], sample, args.masses)
+        if args.preload:
+            # Fail before submitting anything rather than in the first preloaded chunk
+            check_columns(sample_fileset, WrAnalysis.columns(args.era, is_data=sample in DATA_SAMPLES))
+        filtered_fileset.update(sample_fileset)
 
-    if args.sample in ["EGamma", "Muon"]:
-        filename = f"{era}_{args.sample}_fileset.json" if args.unskimmed else f"{era}_data_skimmed_fileset.json"
-    elif args.sample == "Signal":
-        filename = f"{era}_{args.sample}_fileset.json" if args.unskimmed else f"{era}_signal_skimmed_fileset.json"
-    else:
-        filename = f"{era}_{args.sample}_fileset.json" if args.unskimmed else f"{era}_mc_lo_dy_skimmed_fileset.json" 
+    if args.sample == "Signal":
+        found = {signal_mass_point(data['metadata']['sample']) for data in filtered_fileset.values()}
+        missing = [mass for mass in args.masses if mass not in found]
+        if missing:
+            logging.warning(f"No signal datasets found for {missing}")
 
-    filepath = Path("data/jsons") / run / year / era / subdir / filename
+    # Each output file has a manifest of the (file, entry range) pairs merged into it, and of
+    # the analyzer and normalization of every dataset in it
+    dataset_groups = {ds: output_group(args, data['metadata']) for ds, data in filtered_fileset.items()}
+    manifests = {group: {"files": {}} for group in set(dataset_groups.values())}
+    analyzer_config = make_analyzer_config(args)
+    config = {key: analyzer_config[key] for key in HISTOGRAM_OPTIONS}
+    datasets = dataset_records(filtered_fileset, dataset_hashes(analyzer_hash(args, {**config, "reweight": args.reweight}), filtered_fileset))
+    group_datasets = {group: {ds: datasets[ds] for ds in datasets if dataset_groups[ds] == group} for group in manifests}
+    chunk_filter = None
+    if args.incremental:
+        problems = []
+        for group in manifests:
+            manifest_path = get_output_file(group_args(args, group), suffix="_manifest.json")
+            manifests[group] = load_manifest(manifest_path)
+            problems += output_problems(manifest_path, manifests[group], output_files(args, group), group_datasets[group])
+        if problems:
+            # Merging into outputs whose content the manifest does not describe would count events twice
+            logging.error("Cannot run incrementally, rerun without --incremental to rewrite the outputs:\n" + "\n".join(problems))
+            sys.exit(1)
+        for group in manifests:
+            group_fileset = {ds: data for ds, data in filtered_fileset.items() if dataset_groups[ds] == group}
+            removed = removed_files(group_fileset, manifests[group])
+            if removed:
+                logging.error(f"{len(removed)} files already merged into the {group} output are no longer in the fileset; "
+                              f"their events stay in the histograms, rerun without --incremental to drop them:\n" + "\n".join(removed))
+        pruned_fileset = {}
+        for ds, data in filtered_fileset.items():
+            pruned_fileset.update(prune_fileset({ds: data}, manifests[dataset_groups[ds]]))
+        filtered_fileset = pruned_fileset
 
-    logging.info(f"Reading files from {filepath}")
+        def chunk_filter(chunk):
+            return not is_covered(manifests[dataset_groups[chunk.dataset]], chunk.filename, chunk.entrystart, chunk.entrystop)
 
-    preprocessed_fileset = load_json(str(filepath))
-    filtered_fileset = filter_by_process(preprocessed_fileset, args.sample, args.mass)
+        if not filtered_fileset:
+            logging.info("Incremental run: nothing new to process.")
+            sys.exit(0)
+        logging.info(f"Incremental run: {sum(len(data['files']) for data in filtered_fileset.values())} new or partially processed files")
 
     t0 = time.monotonic()
-    hists_dict = run_analysis(args, filtered_fileset, args.condor)
+    hists_dict, metrics, chunks = run_analysis(args, filtered_fileset, args.condor, chunk_filter)
 
     if not args.debug:
-        save_histograms(hists_dict, args)
+        # One Runner pass for all samples or mass points; each is still saved to its own file
+        for group, group_hists in split_outputs(args, hists_dict, filtered_fileset).items():
+            save_histograms(group_hists, group_args(args, group), merge_existing=args.incremental)
+            save_cutflow(group_hists, group_args(args, group), merge_existing=args.incremental)
+
+        for group, manifest in manifests.items():
+            group_chunks = [chunk for chunk in chunks if dataset_groups[chunk.dataset] == group]
+            if group_chunks:
+                record_chunks(manifest, group_chunks)
+                record_datasets(manifest, group_datasets[group])
+                record_outputs(manifest, output_files(args, group))
+                save_manifest(get_output_file(group_args(args, group), suffix="_manifest.json"), manifest)
+    save_report(build_report(args, metrics), args.metrics_report or default_report_path(args))
+
     exec_time = time.monotonic() - t0
     logging.info(f"Execution took {exec_time/60:.2f} minutes")
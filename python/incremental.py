@@ -0,0 +1,135 @@
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+
+def load_manifest(path):
+    """
+    Load the manifest of an output file: for every input file, the entry ranges that have
+    been processed into it and its number of entries. A missing manifest is empty.
+    """
+    path = Path(path)
+    if not path.exists():
+        return {"files": {}}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def save_manifest(path, manifest):
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, path)
+    logging.info(f"Manifest saved to {path}.")
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def record_outputs(manifest, paths):
+    """
+    Store the digest of the output files the manifest describes. The manifest is saved
+    after the outputs, so a crash in between leaves digests that no longer match.
+    """
+    manifest["outputs"] = {Path(p).name: file_digest(p) for p in paths if Path(p).exists()}
+    return manifest
+
+def dataset_records(fileset, hashes):
+    """
+    What the histograms of every dataset depend on besides its files: the analyzer hash
+    (code, configuration and metadata, see chunk_cache.dataset_hashes) and the normalization.
+    """
+    return {
+        dataset: {"analyzer": hashes[dataset], "xsec": data["metadata"].get("xsec"), "nevts": data["metadata"].get("nevts")}
+        for dataset, data in fileset.items()
+    }
+
+def record_datasets(manifest, records):
+    """Store the dataset records of the datasets merged into the output."""
+    manifest.setdefault("datasets", {}).update(records)
+    return manifest
+
+def dataset_problems(manifest_path, manifest, records):
+    """Datasets of the output whose normalization or analyzer changed since it was written."""
+    recorded = manifest.get("datasets")
+    if recorded is None:
+        return [f"{manifest_path} does not record the analyzer and normalization of its datasets"] if manifest["files"] else []
+    problems = []
+    for dataset, record in records.items():
+        old = recorded.get(dataset)
+        if old is None:
+            continue
+        if (old["xsec"], old["nevts"]) != (record["xsec"], record["nevts"]):
+            problems.append(f"{dataset}: xsec/nevts changed from {old['xsec']}/{old['nevts']} to {record['xsec']}/{record['nevts']} since {manifest_path} was saved")
+        elif old["analyzer"] != record["analyzer"]:
+            problems.append(f"{dataset}: the analyzer code or configuration changed since {manifest_path} was saved")
+    return problems
+
+def output_problems(manifest_path, manifest, paths, datasets=None):
+    """
+    Reasons why existing output files cannot be merged into: outputs without a manifest
+    (written before manifests existed, or whose manifest was deleted), outputs that
+    differ from those the manifest was saved with (e.g. a crash between the two writes),
+    or, given the dataset records of this run, datasets made with a different analyzer or
+    normalization.
+    """
+    existing = [Path(p) for p in paths if Path(p).exists()]
+    if not Path(manifest_path).exists():
+        return [f"{p} exists without a manifest" for p in existing]
+    recorded = manifest.get("outputs")
+    if recorded is None:
+        return [f"{manifest_path} does not record the digests of its outputs"] if existing else []
+    problems = [f"{p} is not the file recorded in {manifest_path}" for p in existing if recorded.get(p.name) != file_digest(p)]
+    problems += [f"{name} is recorded in {manifest_path} but missing" for name in recorded if not (Path(manifest_path).parent / name).exists()]
+    if datasets is not None:
+        problems += dataset_problems(manifest_path, manifest, datasets)
+    return problems
+
+def merge_ranges(ranges):
+    """Sort and merge overlapping or adjacent [start, stop) ranges."""
+    merged = []
+    for start, stop in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], stop)
+        else:
+            merged.append([start, stop])
+    return merged
+
+def is_covered(manifest, filename, entrystart, entrystop):
+    entry = manifest["files"].get(filename)
+    if entry is None:
+        return False
+    return any(start <= entrystart and entrystop <= stop for start, stop in entry["ranges"])
+
+def is_complete(manifest, filename):
+    entry = manifest["files"].get(filename)
+    return entry is not None and is_covered(manifest, filename, 0, entry["numentries"])
+
+def prune_fileset(fileset, manifest):
+    """
+    Drop the files that are fully processed according to the manifest, so they are not
+    even opened during preprocessing. Datasets left without files are dropped.
+    """
+    pruned = {}
+    for dataset, data in fileset.items():
+        files = {f: tree for f, tree in data["files"].items() if not is_complete(manifest, f)}
+        if files:
+            pruned[dataset] = {**data, "files": files}
+    return pruned
+
+def removed_files(fileset, manifest):
+    """Files that contributed to the saved output but are no longer in the fileset."""
+    current = {f for data in fileset.values() for f in data["files"]}
+    return sorted(f for f in manifest["files"] if f not in current)
+
+def record_chunks(manifest, chunks):
+    """Add the entry ranges of processed chunks to the manifest."""
+    for chunk in chunks:
+        entry = manifest["files"].setdefault(chunk.filename, {"ranges": [], "numentries": 0})
+        entry["ranges"] = merge_ranges(entry["ranges"] + [[chunk.entrystart, chunk.entrystop]])
+        entry["numentries"] = max(entry["numentries"], chunk.entrystop)
+    return manifest
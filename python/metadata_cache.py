@@ -0,0 +1,144 @@
+import json
+import logging
+import os
+import time
+import uuid
+from collections.abc import MutableMapping
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+DEFAULT_METADATA_CACHE = Path(".cache") / "preprocess_metadata.json"
+DEFAULT_MAX_AGE = 24 * 3600
+
+def is_remote(filename):
+    return "://" in filename and not filename.startswith("file://")
+
+def remote_stat(filename, timeout=30):
+    """Size and modification time of an XRootD file from a server stat, None if unavailable."""
+    try:
+        from XRootD import client
+    except ImportError:
+        return None
+    url = client.URL(filename)
+    status, info = client.FileSystem(f"{url.protocol}://{url.hostid}").stat(url.path, timeout=timeout)
+    if not status.ok:
+        logging.debug(f"Could not stat {filename}: {status.message}")
+        return None
+    return [info.size, info.modtime]
+
+class PersistentMetadataCache(MutableMapping):
+    """
+    On-disk cache of Runner.preprocess results (entry count, file UUID, cluster boundaries),
+    passed to the Runner as metadata_cache so only new or changed files are opened.
+
+    Entries are keyed by file path and tree name and store the size and modification time
+    of the file (os.stat locally, an XRootD stat remotely); an entry is ignored once the file
+    changes. Files that cannot be stat'ed (no XRootD bindings, server error) are only
+    trusted for max_age seconds.
+    """
+    def __init__(self, path=DEFAULT_METADATA_CACHE, max_age=DEFAULT_MAX_AGE):
+        self.path = Path(path)
+        self.max_age = max_age
+        self._entries = {}
+        self._stamps = {}
+        self._dirty = False
+        if self.path.exists():
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError) as e:
+                logging.warning(f"Ignoring unreadable preprocessing cache {self.path}: {e}")
+
+    @staticmethod
+    def _key(filemeta):
+        return f"{filemeta.treename}:{filemeta.filename}"
+
+    @staticmethod
+    def _stat(filename):
+        """Size and mtime of a file, None if it cannot be stat'ed."""
+        if is_remote(filename):
+            return remote_stat(filename)
+        try:
+            stat = os.stat(filename.replace("file://", "", 1))
+        except OSError:
+            return None
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def _stamp(self, filename):
+        if filename not in self._stamps:
+            self._stamps[filename] = self._stat(filename)
+        return self._stamps[filename]
+
+    def prefetch(self, filenames, workers=16):
+        """
+        Stat the remote files in parallel ahead of preprocessing, which looks up and stores
+        the cache entries one file at a time on the client.
+        """
+        remote = [f for f in dict.fromkeys(filenames) if is_remote(f) and f not in self._stamps]
+        if not remote:
+            return
+        with ThreadPoolExecutor(workers) as pool:
+            self._stamps.update(zip(remote, pool.map(self._stat, remote)))
+
+    @staticmethod
+    def _encode(metadata):
+        encoded = dict(metadata)
+        if isinstance(encoded.get("uuid"), (bytes, bytearray)):
+            encoded["uuid"] = {"bytes": bytes(encoded["uuid"]).hex()}
+        elif isinstance(encoded.get("uuid"), uuid.UUID):
+            encoded["uuid"] = {"uuid": str(encoded["uuid"])}
+        if "clusters" in encoded:
+            encoded["clusters"] = [int(c) for c in encoded["clusters"]]
+        encoded["numentries"] = int(encoded["numentries"])
+        return encoded
+
+    @staticmethod
+    def _decode(encoded):
+        metadata = dict(encoded)
+        file_uuid = metadata.get("uuid")
+        if isinstance(file_uuid, dict):
+            metadata["uuid"] = bytes.fromhex(file_uuid["bytes"]) if "bytes" in file_uuid else uuid.UUID(file_uuid["uuid"])
+        return metadata
+
+    def __getitem__(self, filemeta):
+        entry = self._entries.get(self._key(filemeta))
+        if entry is None:
+            raise KeyError(filemeta)
+        stamp = self._stamp(filemeta.filename)
+        if stamp is None or entry["stamp"] is None:
+            # Unverifiable: only trust recent entries
+            if time.time() - entry.get("cached_at", 0) > self.max_age:
+                raise KeyError(filemeta)
+        elif entry["stamp"] != stamp:
+            raise KeyError(filemeta)
+        return self._decode(entry["metadata"])
+
+    def __setitem__(self, filemeta, metadata):
+        self._entries[self._key(filemeta)] = {
+            "stamp": self._stamp(filemeta.filename),
+            "cached_at": time.time(),
+            "metadata": self._encode(metadata),
+        }
+        self._dirty = True
+
+    def __delitem__(self, filemeta):
+        del self._entries[self._key(filemeta)]
+        self._dirty = True
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def save(self):
+        """Write the cache if anything changed; the file is replaced atomically."""
+        if not self._dirty:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+        logging.info(f"Preprocessing cache saved to {self.path} ({len(self)} files)")
@@ -0,0 +1,134 @@
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+class WorkerSampler:
+    """
+    Record the number of Dask workers every `interval` seconds in a background thread,
+    as a list of (seconds since start, workers) pairs.
+    """
+    def __init__(self, client, interval=10):
+        self.client = client
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        start = time.monotonic()
+        while True:
+            try:
+                n_workers = len(self.client.scheduler_info()["workers"])
+            except Exception as e:  # the client may be closing
+                logging.debug(f"Could not sample the number of workers: {e}")
+            else:
+                self.samples.append((round(time.monotonic() - start, 1), n_workers))
+            if self._stop.wait(self.interval):
+                break
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+def rate(numerator, denominator):
+    return numerator / denominator if denominator else None
+
+def phases(metrics, chunk_records):
+    """
+    Split the wall time of the Runner call into the time before the first chunk started
+    (scheduling, worker startup), the time after the last chunk finished (final merge and
+    transfer of the outputs), and the time spent in process() summed over all chunks.
+    """
+    run_start, run_end = metrics.get("run_start"), metrics.get("run_end")
+    compute = sum(record["seconds"] for record in chunk_records)
+    if run_start is None or not chunk_records:
+        return {"compute": compute, "startup": None, "merge_tail": None, "utilization": None}
+
+    first_start = min(record["start"] for record in chunk_records)
+    last_end = max(record["start"] + record["seconds"] for record in chunk_records)
+    max_workers = max((n for _, n in metrics.get("workers", [])), default=1)
+    return {
+        "compute": compute,
+        "startup": max(first_start - run_start, 0.0),
+        "merge_tail": max(run_end - last_end, 0.0),
+        # Fraction of the worker slots spent in process()
+        "utilization": rate(compute, (run_end - run_start) * max_workers),
+    }
+
+def build_report(args, metrics):
+    """
+    Machine-readable report of one run_analysis.py invocation, from the Runner metrics
+    (bytes and columns read, process time), the per-chunk records of the processor and
+    the sampled number of workers.
+    """
+    chunk_records = metrics.get("chunk_metrics", [])
+    wall_time = metrics.get("wall_time", 0.0)
+
+    datasets = {}
+    for record in chunk_records:
+        entry = datasets.setdefault(record["dataset"], {"chunks": 0, "events": 0, "seconds": 0.0})
+        entry["chunks"] += 1
+        entry["events"] += record["events"]
+        entry["seconds"] += record["seconds"]
+    for entry in datasets.values():
+        entry["events_per_second"] = rate(entry["events"], entry["seconds"])
+
+    for record in chunk_records:
+        record["events_per_second"] = rate(record["events"], record["seconds"])
+
+    entries = metrics.get("entries", 0)
+    processtime = metrics.get("processtime", 0.0)
+    bytesread = metrics.get("bytesread", 0)
+    columns = sorted(metrics.get("columns", []))
+
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "era": args.era,
+        "samples": args.samples,
+        "masses": args.masses,
+        "executor": metrics.get("executor"),
+        "chunksize": metrics.get("chunksize", {}),
+        "wall_time": wall_time,
+        "phases": phases(metrics, chunk_records),
+        "totals": {
+            "chunks": metrics.get("chunks", len(chunk_records)),
+            "events": entries,
+            "bytesread": bytesread,
+            "columns": columns,
+            "n_columns": len(columns),
+            "processtime": processtime,
+            "events_per_second": rate(entries, wall_time),
+            "events_per_cpu_second": rate(entries, processtime),
+            "bytes_per_second": rate(bytesread, wall_time),
+        },
+        "datasets": datasets,
+        "chunks": chunk_records,
+        "workers": metrics.get("workers", []),
+        "stage_timing": metrics.get("stage_timing", {}),
+        "transfer": metrics.get("transfer"),
+        "reduction": metrics.get("reduction"),
+        "scaling": metrics.get("scaling", []),
+    }
+
+def default_report_path(args):
+    """metrics/<era>_<samples>_<timestamp>.json"""
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return Path("metrics") / f"{args.era}_{'_'.join(args.samples)}_{stamp}.json"
+
+def save_report(report, path):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=1)
+    logging.info(f"Metrics report saved to {path}.")
+
+def load_report(path):
+    with open(path) as f:
+        return json.load(f)
@@ -3,6 +3,7 @@ from pathlib import Path
 import json
 import logging
 import difflib
+import uproot
 
 # Mapping of eras to dataset paths
 ERA_MAPPING = {
@@ -41,6 +42,23 @@ def load_json(filepath):
         logging.error(f"Failed to read JSON file {filepath}: {e}")
         sys.exit(1)
 
+def check_columns(fileset, columns, treename="Events", timeout=60):
+    """
+    Open the first file of every dataset and fail fast if any branch of the
+    analyzer's column manifest is missing.
+    """
+    for dataset, info in fileset.items():
+        files = info["files"]
+        if not files:
+            continue
+        filename = next(iter(files))
+        with uproot.open(filename, timeout=timeout) as f:
+            tree = f[treename]
+            missing = [c for c in columns if c not in tree]
+        if missing:
+            logging.error(f"Dataset {dataset}: {filename} is missing branches {missing}")
+            raise KeyError(f"Missing branches in {dataset}: {missing}")
+
 def save_json(output_file, data, data_all):
     """
     Save the processed JSON data to a file. If data and data_all are different,
@@ -1,5 +1,6 @@
 import uproot
 import os
+import json
 import logging
 from pathlib import Path
 import hist
@@ -10,9 +11,9 @@ from python.preprocess_utils import get_era_details
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(levelname)s - %(message)s')
 
-def save_histograms(histograms, args):
+def get_output_file(args, suffix=".root"):
     """
-    Takes in raw histograms, processes them and saves the output to ROOT files.
+    Build the output file path for a sample (e.g. WR_Plotter/rootfiles/Run3/2022/Run3Summer22/WRAnalyzer_DYJets.root).
     """
     run, year, era = get_era_details(args.era)
     sample = args.sample
@@ -22,7 +23,6 @@ def save_histograms(histograms, args):
     working_dir = Path("WR_Plotter")
 
     # Build working directory
-   # Build working directory
     if getattr(args, 'dir', None):
         output_dir = working_dir / 'rootfiles' / run / year / era / args.dir
     else:
@@ -38,22 +38,97 @@ def save_histograms(histograms, args):
         filename_prefix = f"WRAnalyzer"
 
     if sample == "Signal":
-        output_file = output_dir / f"{filename_prefix}_signal_{hnwr_mass}.root"
+        return output_dir / f"{filename_prefix}_signal_{hnwr_mass}{suffix}"
     else:
-        output_file= output_dir / f"{filename_prefix}_{sample}.root"
+        return output_dir / f"{filename_prefix}_{sample}{suffix}"
+
+def merge_with_existing(output_file, histograms):
+    """
+    Add the histograms already saved in output_file to the new ones (keyed by ROOT path).
+    Histograms only present in the file are kept as they are.
+    """
+    merged = {}
+    with uproot.open(output_file) as root_file:
+        for path, classname in root_file.classnames().items():
+            if classname.startswith(("TH1", "TH2")):
+                merged["/" + path.split(";")[0]] = root_file[path].to_hist()
+
+    for path, hist_obj in histograms.items():
+        if path not in merged:
+            merged[path] = hist_obj
+            continue
+        existing = merged[path]
+        total = hist_obj.copy()
+        view = total.view(flow=True)
+        if total.storage_type is hist.storage.Weight:
+            view["value"] += existing.values(flow=True)
+            view["variance"] += existing.variances(flow=True)
+        else:
+            view += existing.values(flow=True)
+        merged[path] = total
+    return merged
+
+def save_histograms(histograms, args, merge_existing=False):
+    """
+    Takes in raw histograms, processes them and saves the output to ROOT files.
+    With merge_existing, the histograms are added to those already in the output file.
+    """
+    output_file = get_output_file(args)
 
     # Process histograms
 #    scaled_hists = scale_hists(histograms)
     summed_hist = sum_hists(histograms)
     split_histograms_dict = split_hists(summed_hist)
 
-    with uproot.recreate(output_file) as root_file:
-        for (region, hist_name), hist_obj in split_histograms_dict.items():
-            path = f'/{region}/{hist_name}_{region}'
+    output_hists = {
+        f'/{region}/{hist_name}_{region}': hist_obj
+        for (region, hist_name), hist_obj in split_histograms_dict.items()
+    }
+    if merge_existing and output_file.exists():
+        output_hists = merge_with_existing(output_file, output_hists)
+        logging.info(f"Merged with the histograms already in {output_file}.")
+
+    # Written next to the output and renamed over it, so a crash never leaves a partial file
+    tmp_file = output_file.with_name(output_file.name + ".tmp")
+    with uproot.recreate(tmp_file) as root_file:
+        for path, hist_obj in output_hists.items():
             root_file[path] = hist_obj
+    os.replace(tmp_file, output_file)
 
     logging.info(f"Histograms saved to {output_file}.")
 
+def save_cutflow(histograms, args, merge_existing=False):
+    """
+    Sum the cutflow accumulators over datasets and write them as JSON next to the ROOT output.
+    With merge_existing, the yields are added to those already in the JSON file.
+    """
+    output_file = get_output_file(args, suffix="_cutflow.json")
+
+    cutflow = {}
+    if merge_existing and output_file.exists():
+        with open(output_file) as f:
+            cutflow = json.load(f)
+    for dataset_info in histograms.values():
+        weighted = dataset_info.get("cutflow", {})
+        unweighted = dataset_info.get("cutflow_unweighted", {})
+        for region, h in weighted.items():
+            values = h.project("cut")
+            raw = unweighted[region].project("cut")
+            cuts = [values.axes["cut"].value(i) for i in range(values.axes["cut"].size)]
+            region_cutflow = cutflow.setdefault(region, {})
+            for i, cut in enumerate(cuts):
+                entry = region_cutflow.setdefault(cut, {"sumw": 0.0, "sumw2": 0.0, "raw": 0})
+                entry["sumw"] += float(values.view().value[i])
+                entry["sumw2"] += float(values.view().variance[i])
+                entry["raw"] += int(raw.view()[i])
+
+    tmp_file = output_file.with_name(output_file.name + ".tmp")
+    with open(tmp_file, "w") as f:
+        json.dump(cutflow, f, indent=4)
+    os.replace(tmp_file, output_file)
+
+    logging.info(f"Cutflow saved to {output_file}.")
+
 
 def scale_hists(data):
     """
@@ -70,6 +145,32 @@ def scale_hists(data):
             logging.warning(f"Dataset {dataset_key} missing 'x_sec' or 'sumw'. Skipping scaling.")
     return data
 
+# Storage promotion order when histograms of different samples are summed
+STORAGE_ORDER = [hist.storage.Int64, hist.storage.Double, hist.storage.Weight]
+
+def promote_storage(h, storage):
+    """
+    Copy a histogram into a wider storage. Int64 and Double histograms come from unit-weight
+    data, so their sum of squared weights equals the sum of weights.
+    """
+    if h.storage_type is storage:
+        return h
+    promoted = Hist(*h.axes, storage=storage())
+    values = h.values(flow=True)
+    view = promoted.view(flow=True)
+    if storage is hist.storage.Weight:
+        view["value"][...] = values
+        view["variance"][...] = values
+    else:
+        view[...] = values
+    return promoted
+
+def is_histogram(value):
+    """
+    True for hist.Hist objects and for the analyzer's sparse accumulators, which densify with to_hist().
+    """
+    return isinstance(value, Hist) or hasattr(value, "to_hist")
+
 def sum_hists(my_hists):
     """
     Sum histograms across datasets (e.g. Merge all of the HT binned DY histograms into a single DYJets).
@@ -77,24 +178,32 @@ def sum_hists(my_hists):
     if not my_hists:
         raise ValueError("No histogram data provided.")
 
-    original_histograms = list(my_hists.values())[0]
-    sum_histograms = {
-        key: Hist(*original_histograms[key].axes, 
-            storage=original_histograms[key].storage_type())
-        for key in original_histograms
-        if isinstance(original_histograms[key], Hist)
-    }
-
+    sum_histograms = {}
     for dataset_info in my_hists.values():
         for key, value in dataset_info.items():
-            if isinstance(value, Hist):
+            if is_histogram(value):
                 hist_name = key
                 hist_data = value
                 if hist_name in sum_histograms:
-                    sum_histograms[hist_name] += hist_data
+                    total = sum_histograms[hist_name]
+                    if isinstance(total, Hist) and total.storage_type is not hist_data.storage_type:
+                        storage = max(total.storage_type, hist_data.storage_type, key=STORAGE_ORDER.index)
+                        total = promote_storage(total, storage)
+                        hist_data = promote_storage(hist_data, storage)
+                    total += hist_data
+                    sum_histograms[hist_name] = total
                 else:
                     sum_histograms[hist_name] = hist_data.copy()
 
+    # Sparse accumulators are only densified once, after summing over datasets.
+    # Int64 count histograms are written as Double, like every other data histogram.
+    for hist_name, hist_data in sum_histograms.items():
+        if not isinstance(hist_data, Hist):
+            hist_data = hist_data.to_hist()
+        if hist_data.storage_type is hist.storage.Int64:
+            hist_data = promote_storage(hist_data, hist.storage.Double)
+        sum_histograms[hist_name] = hist_data
+
     return sum_histograms
 
 def split_hists(summed_hists):
@@ -0,0 +1,116 @@
+import logging
+import math
+import threading
+import time
+
+# Task states that still need a worker
+BACKLOG_STATES = ("released", "waiting", "queued", "no-worker", "processing")
+
+class ScalingPolicy:
+    """
+    Number of workers a run needs, from the number of tasks left and the time per task.
+
+    Preprocessing opens every file, so it runs on one worker per file, up to
+    preprocess_workers. The cluster is then sized so that the chunks would take about
+    target_seconds. While running, it grows when there are more than backlog_per_worker tasks left per worker and
+    the backlog would take longer than target_seconds on the current workers, and it
+    shrinks in the tail, once fewer tasks are left than there are workers.
+    """
+    def __init__(self, min_workers=1, max_workers=200, target_seconds=1800, backlog_per_worker=2, preprocess_workers=20):
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.target_seconds = target_seconds
+        self.backlog_per_worker = backlog_per_worker
+        self.preprocess_workers = preprocess_workers
+
+    def clamp(self, n_workers):
+        return max(self.min_workers, min(int(n_workers), self.max_workers))
+
+    def preprocessing(self, n_files):
+        return self.clamp(min(n_files, self.preprocess_workers))
+
+    def initial(self, n_chunks, seconds_per_chunk):
+        return self.clamp(math.ceil(n_chunks * seconds_per_chunk / self.target_seconds))
+
+    def desired(self, backlog, n_workers, seconds_per_chunk):
+        if backlog > self.backlog_per_worker * n_workers:
+            needed = math.ceil(backlog * seconds_per_chunk / self.target_seconds)
+            return self.clamp(max(needed, n_workers))
+        if backlog < n_workers:
+            # Tail: the remaining tasks keep at most one worker busy each
+            return self.clamp(backlog)
+        return self.clamp(n_workers)
+
+def is_chunk_task(ts):
+    """
+    Chunk tasks only depend on data scattered from the client (the processor), which has no
+    run_spec; the merge tasks of the reduction tree depend on the outputs of other tasks.
+    """
+    return all(dep.run_spec is None for dep in ts.dependencies)
+
+def scheduler_backlog(dask_scheduler):
+    """Number of chunk tasks on the scheduler that have not finished yet (run with Client.run_on_scheduler)."""
+    return sum(1 for ts in dask_scheduler.tasks.values() if ts.state in BACKLOG_STATES and is_chunk_task(ts))
+
+class Autoscaler:
+    """
+    Apply a ScalingPolicy to a Dask cluster (an LPCCondorCluster, or a LocalCluster to try it
+    out) every `interval` seconds in a background thread. The time per task starts at
+    seconds_per_chunk and is then measured from the number of tasks finished per worker.
+    Every decision is recorded in `history` as (seconds since start, backlog, workers, target).
+    """
+    def __init__(self, cluster, client, policy, seconds_per_chunk, interval=30, smoothing=0.3):
+        self.cluster = cluster
+        self.client = client
+        self.policy = policy
+        self.seconds_per_chunk = seconds_per_chunk
+        self.interval = interval
+        self.smoothing = smoothing
+        self.history = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def n_workers(self):
+        return len(self.client.scheduler_info()["workers"])
+
+    def scale(self, n_workers):
+        logging.info(f"Scaling the cluster to {n_workers} workers")
+        self.cluster.scale(n_workers)
+
+    def update_seconds_per_chunk(self, finished, n_workers, elapsed):
+        # Only tasks that finished on a full interval of busy workers say something about the time per task
+        if finished > 0 and n_workers > 0:
+            measured = n_workers * elapsed / finished
+            self.seconds_per_chunk += self.smoothing * (measured - self.seconds_per_chunk)
+
+    def step(self, previous_backlog, elapsed):
+        backlog = self.client.run_on_scheduler(scheduler_backlog)
+        n_workers = self.n_workers()
+        if previous_backlog is not None and backlog <= previous_backlog:
+            self.update_seconds_per_chunk(previous_backlog - backlog, n_workers, elapsed)
+        target = self.policy.desired(backlog, n_workers, self.seconds_per_chunk)
+        if target != n_workers:
+            self.scale(target)
+        return backlog, n_workers, target
+
+    def _run(self):
+        start = last = time.monotonic()
+        backlog = None
+        while not self._stop.wait(self.interval):
+            now = time.monotonic()
+            try:
+                backlog, n_workers, target = self.step(backlog, now - last)
+            except Exception as e:  # the client may be closing
+                logging.debug(f"Autoscaler step failed: {e}")
+                continue
+            finally:
+                last = now
+            self.history.append((round(now - start, 1), backlog, n_workers, target))
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+#
+# -----------------------------------------------------------------------------
+# Runs the full bin/run_analysis.py path (preprocess, Runner, accumulation,
+# save_histograms) on a generated local DYJets fileset under several executors
+# and worker counts, and reports wall time, scaling efficiency and how the
+# Runner time splits into worker compute, startup and the final merge.
+#
+# Example usage:
+#   python3 scripts/benchmark/bench_end_to_end.py Run3Summer22
+#   python3 scripts/benchmark/bench_end_to_end.py Run3Summer22 --events 4000000 --files 16 --configs iterative:1 futures:4 futures:8 dask:4 dask:8
+#
+# Output:
+#   benchmarks/end_to_end_<era>_<commit>_<timestamp>.json
+# -----------------------------------------------------------------------------
+import argparse
+import json
+import logging
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+repo_root = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(repo_root))
+sys.path.insert(0, str(repo_root / "src"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from bench_process import git_commit
+from lumi_mask import GOLDEN_JSONS
+from make_synthetic_nanoaod import write_file
+from python.metrics import load_report
+from python.preprocess_utils import get_era_details
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+DEFAULT_CONFIGS = ["iterative:1", "futures:1", "futures:2", "futures:4", "dask:1", "dask:2", "dask:4"]
+
+def parse_config(config):
+    """'futures:4' -> ('futures', 4)"""
+    executor, _, workers = config.partition(":")
+    if executor not in ("iterative", "futures", "dask"):
+        raise argparse.ArgumentTypeError(f"Unknown executor '{executor}' in '{config}'")
+    return executor, int(workers or 1)
+
+def make_fileset(cache_dir, era, n_events, n_files, seed):
+    """DYJets fileset of n_files synthetic files, written once per (era, events, files, seed) and reused."""
+    run, year, era = get_era_details(era)
+    output_dir = cache_dir / era / f"DYJets_{n_events}_{n_files}_{seed}"
+    fileset_path = output_dir / "fileset.json"
+    if fileset_path.exists():
+        return fileset_path
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    files, sumw = {}, 0.0
+    per_file = -(-n_events // n_files)
+    for i in range(n_files):
+        size = min(per_file, n_events - i * per_file)
+        if size <= 0:
+            break
+        path = output_dir / f"DYJets_{i}.root"
+        sumw += write_file(path, rng, era, size, False, "background", first_event=i * per_file + 1)
+        files[str(path)] = "Events"
+        logging.info(f"Wrote {size} events to {path}")
+
+    metadata = {"run": run, "year": year, "era": era, "sample": "DYJets_synthetic", "physics_group": "DYJets",
+                "datatype": "mc", "xsec": 1.0, "nevts": sumw}
+    with open(fileset_path, "w") as f:
+        json.dump({"DYJets_synthetic": {"files": files, "metadata": metadata}}, f, indent=4)
+    return fileset_path
+
+def run_config(era, fileset_path, executor, workers, report_path):
+    """One run_analysis.py invocation; returns its total wall time, including startup and saving."""
+    command = [
+        sys.executable, "bin/run_analysis.py", era, "DYJets",
+        "--fileset", str(fileset_path),
+        "--executor", executor,
+        "--workers", str(workers),
+        "--no-metadata-cache",
+        "--dir", f"end_to_end_bench/{executor}_{workers}",
+        "--metrics-report", str(report_path),
+    ]
+    logging.info(f"Running {' '.join(command)}")
+    start = time.monotonic()
+    subprocess.run(command, cwd=repo_root, check=True)
+    return time.monotonic() - start
+
+def summarize(executor, workers, total_seconds, report):
+    totals, phases = report["totals"], report["phases"]
+    return {
+        "executor": executor,
+        "workers": workers,
+        "total_seconds": total_seconds,
+        "runner_seconds": report["wall_time"],
+        # Preprocessing, histogram saving and interpreter startup
+        "outside_runner_seconds": total_seconds - report["wall_time"],
+        "events": totals["events"],
+        "events_per_second": totals["events_per_second"],
+        "compute_seconds": phases["compute"],
+        "startup_seconds": phases["startup"],
+        "merge_tail_seconds": phases["merge_tail"],
+        "utilization": phases["utilization"],
+        "expected_reduction_depth": (report.get("reduction") or {}).get("expected_depth"),
+        "report": report["path"],
+    }
+
+def add_scaling(results):
+    """
+    Scaling efficiency of every run with respect to the run of the same executor with the
+    fewest workers: (rate / reference rate) / (workers / reference workers).
+    """
+    for result in results:
+        same = [r for r in results if r["executor"] == result["executor"] and r["events_per_second"]]
+        if not same or not result["events_per_second"]:
+            result["scaling_efficiency"] = None
+            continue
+        ref = min(same, key=lambda r: r["workers"])
+        speedup = result["events_per_second"] / ref["events_per_second"]
+        result["scaling_efficiency"] = speedup / (result["workers"] / ref["workers"])
+
+def fmt(value, spec=".3g"):
+    return "-" if value is None else format(value, spec)
+
+def print_results(results):
+    print(f"{'executor':<10} {'workers':>7} {'total [s]':>10} {'runner [s]':>11} {'events/s':>10} {'efficiency':>11} "
+          f"{'compute [s]':>12} {'startup [s]':>12} {'merge [s]':>10} {'util':>6}")
+    for r in results:
+        print(f"{r['executor']:<10} {r['workers']:>7} {fmt(r['total_seconds']):>10} {fmt(r['runner_seconds']):>11} "
+              f"{fmt(r['events_per_second']):>10} {fmt(r['scaling_efficiency'], '.2f'):>11} {fmt(r['compute_seconds']):>12} "
+              f"{fmt(r['startup_seconds']):>12} {fmt(r['merge_tail_seconds']):>10} {fmt(r['utilization'], '.2f'):>6}")
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end throughput of run_analysis.py across executors.")
+    parser.add_argument("era", type=str, choices=list(GOLDEN_JSONS), help="Campaign of the synthetic events.")
+    parser.add_argument("--configs", type=parse_config, nargs="+", default=[parse_config(c) for c in DEFAULT_CONFIGS],
+                        help="Executor and number of workers of every run, as executor:workers.")
+    parser.add_argument("--events", type=int, default=2_000_000, help="Total number of events in the fileset.")
+    parser.add_argument("--files", type=int, default=16, help="Number of files the events are split into.")
+    parser.add_argument("--seed", type=int, default=12345, help="Random seed of the synthetic events.")
+    parser.add_argument("--cache-dir", type=str, default="synthetic_nanoaod/end_to_end", help="Directory for the synthetic files.")
+    parser.add_argument("--output", type=str, default=None, help="Results file (default: benchmarks/end_to_end_<era>_<commit>_<timestamp>.json).")
+    args = parser.parse_args()
+
+    fileset_path = make_fileset(Path(args.cache_dir).resolve(), args.era, args.events, args.files, args.seed)
+    commit = git_commit()
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    report_dir = repo_root / "benchmarks" / f"end_to_end_{args.era}_{commit}_{stamp}"
+
+    results = []
+    for executor, workers in args.configs:
+        report_path = report_dir / f"{executor}_{workers}.json"
+        total_seconds = run_config(args.era, fileset_path, executor, workers, report_path)
+        report = load_report(report_path)
+        report["path"] = str(report_path)
+        results.append(summarize(executor, workers, total_seconds, report))
+    add_scaling(results)
+
+    output = Path(args.output or report_dir.with_suffix(".json"))
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "commit": commit,
+            "era": args.era,
+            "events": args.events,
+            "files": args.files,
+            "seed": args.seed,
+            "results": results,
+        }, f, indent=1)
+    logging.info(f"Results saved to {output}; the run_analysis.py reports are in {report_dir}")
+
+    print_results(results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+#
+# -----------------------------------------------------------------------------
+# Benchmarks WrAnalysis.process on fixed synthetic chunks, without network or GPU.
+# Every (scenario, chunk size) point runs in a fresh process, so that its peak
+# memory is not hidden by an earlier, larger point.
+#
+# Scenarios:
+#   mc      DYJets background
+#   data    EGamma, with the lumi mask of the era
+#   signal  WR signal sample (harder spectra, more events in the signal regions)
+#   dy_sf   DYJets with a DY reweighting file (the sf_file path)
+#
+# Example usage:
+#   python3 scripts/benchmark/bench_process.py Run3Summer22
+#   python3 scripts/benchmark/bench_process.py Run3Summer22 --scenarios mc data --sizes 10000 100000 --repeats 5
+#   # Compare with an earlier result, or two saved results with each other
+#   python3 scripts/benchmark/bench_process.py Run3Summer22 --compare benchmarks/process_Run3Summer22_1a2b3c4_20250101_120000.json
+#   python3 scripts/benchmark/bench_process.py Run3Summer22 --compare benchmarks/a.json benchmarks/b.json
+#
+# Output:
+#   benchmarks/process_<era>_<commit>_<timestamp>.json
+# -----------------------------------------------------------------------------
+import argparse
+import json
+import logging
+import multiprocessing
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+repo_root = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(repo_root))
+sys.path.insert(0, str(repo_root / "src"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from lumi_mask import GOLDEN_JSONS
+from make_synthetic_nanoaod import write_file
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+SIGNAL_MASS = "WR4000_N2100"
+
+SCENARIOS = {
+    "mc":     {"physics_group": "DYJets", "sample": "DYJets_synthetic", "profile": "background", "is_data": False},
+    "data":   {"physics_group": "EGamma", "sample": "EGamma_synthetic", "profile": "background", "is_data": True},
+    "signal": {"physics_group": "Signal", "sample": f"WRtoNLtoLLJJ_M{SIGNAL_MASS}_synthetic", "profile": "signal", "is_data": False},
+    "dy_sf":  {"physics_group": "DYJets", "sample": "DYJets_synthetic", "profile": "background", "is_data": False, "sf": True},
+}
+
+# Flat-ish DY correction in m(lljj), only there to exercise the lookup and the per-region weights
+SF_VARIABLE = "mass_fourobject"
+SF_EDGES = [0, 200, 400, 600, 800, 1000, 1500, 2000, 3000, 8000]
+
+def git_commit():
+    """Short hash of HEAD, with a -dirty suffix when src/ has uncommitted changes."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=repo_root, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--", "src"], cwd=repo_root, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return f"{commit}-dirty" if dirty else commit
+
+def input_file(cache_dir, era, scenario, n_events, seed):
+    """Synthetic file of the scenario with at least n_events events, written once and reused."""
+    config = SCENARIOS[scenario]
+    path = cache_dir / era / f"{config['physics_group']}_{n_events}_{seed}.root"
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        rng = np.random.default_rng(seed)
+        logging.info(f"Writing {n_events} {config['physics_group']} events to {path}")
+        write_file(path, rng, era, n_events, config["is_data"], config["profile"], first_event=1)
+    return path
+
+def sf_file(cache_dir):
+    """DY reweighting file in the format read by WrAnalysis (see scripts/derive_reweights.py)."""
+    path = cache_dir / f"{SF_VARIABLE}_sf.json"
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        n_bins = len(SF_EDGES) - 1
+        with open(path, "w") as f:
+            json.dump({
+                "edges": SF_EDGES,
+                "sf_ee_resolved_dy_cr": list(np.linspace(1.1, 0.9, n_bins)),
+                "sf_mumu_resolved_dy_cr": list(np.linspace(1.05, 0.95, n_bins)),
+            }, f, indent=1)
+    return path
+
+def measure(era, scenario, path, size, repeats, sf_path, preload):
+    """
+    Run WrAnalysis.process on the first `size` events of `path` `repeats` times, reading
+    the chunk anew every time as a worker would. Runs in a child process.
+    """
+    from coffea.nanoevents import NanoAODSchema, NanoEventsFactory
+
+    from analyzer import WrAnalysis
+    from chunk_tuning import current_rss, peak_rss
+
+    config = SCENARIOS[scenario]
+    processor_instance = WrAnalysis(
+        mass_point=SIGNAL_MASS if scenario == "signal" else None,
+        sf_file=str(sf_path) if config.get("sf") else None,
+        lumi_eras=[era] if config["is_data"] else [],
+        preload=preload,
+        profile_stages=True,
+    )
+
+    metadata = {
+        "dataset": config["sample"], "filename": str(path), "treename": "Events",
+        "entrystart": 0, "entrystop": size, "fileuuid": "",
+        "era": era, "sample": config["sample"], "physics_group": config["physics_group"],
+    }
+    if not config["is_data"]:
+        metadata.update({"xsec": 1.0, "nevts": float(size)})
+
+    rss_before = current_rss()
+    seconds, stages = [], {}
+    for _ in range(repeats):
+        start = time.perf_counter()
+        events = NanoEventsFactory.from_root(
+            {str(path): "Events"},
+            entry_start=0,
+            entry_stop=size,
+            schemaclass=NanoAODSchema,
+            metadata=dict(metadata),
+            mode="virtual",
+        ).events()
+        output = processor_instance.process(events)
+        seconds.append(time.perf_counter() - start)
+        for stage, t in output[config["sample"]]["stage_timing"].items():
+            stages[stage] = stages.get(stage, 0.0) + t / repeats
+
+    median = statistics.median(seconds)
+    return {
+        "scenario": scenario,
+        "events": size,
+        "seconds": seconds,
+        "median_seconds": median,
+        "events_per_second": size / median if median > 0 else None,
+        "peak_rss": peak_rss(),
+        "peak_memory_growth": max(peak_rss() - rss_before, 0),
+        "stage_timing": stages,
+    }
+
+def run_point(*args):
+    # A fresh interpreter per point, so that ru_maxrss belongs to this point only
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(measure, args)
+
+def fmt(value):
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return f"{value:.4g}"
+    return str(value)
+
+def print_results(results):
+    print(f"{'scenario':<8} {'events':>9} {'events/s':>12} {'median [s]':>11} {'peak mem [MB]':>14}")
+    for r in results:
+        print(f"{r['scenario']:<8} {r['events']:>9} {fmt(r['events_per_second']):>12} {fmt(r['median_seconds']):>11} {r['peak_memory_growth'] / 1e6:>14.1f}")
+
+def compare(ref, other):
+    """Events/s, peak memory and stage times of the points present in both results."""
+    def key(r):
+        return r["scenario"], r["events"]
+    ref_points = {key(r): r for r in ref["results"]}
+
+    print(f"reference {ref['commit']} ({ref['created']}), other {other['commit']} ({other['created']})")
+    print(f"{'scenario':<8} {'events':>9} {'events/s ref':>13} {'other':>12} {'ratio':>7} {'mem ratio':>10}")
+    stage_ratios = {}
+    for r in other["results"]:
+        a = ref_points.get(key(r))
+        if a is None:
+            continue
+        speedup = r["events_per_second"] / a["events_per_second"] if a["events_per_second"] and r["events_per_second"] else None
+        memory = r["peak_memory_growth"] / a["peak_memory_growth"] if a["peak_memory_growth"] else None
+        print(f"{r['scenario']:<8} {r['events']:>9} {fmt(a['events_per_second']):>13} {fmt(r['events_per_second']):>12} "
+              f"{fmt(speedup):>7} {fmt(memory):>10}")
+        for stage, t in r["stage_timing"].items():
+            if a["stage_timing"].get(stage):
+                stage_ratios.setdefault(stage, []).append(t / a["stage_timing"][stage])
+
+    if stage_ratios:
+        print(f"\n{'stage':<18} {'time ratio (median over points)':>32}")
+        for stage, ratios in stage_ratios.items():
+            print(f"{stage:<18} {statistics.median(ratios):>32.2f}")
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark WrAnalysis.process on synthetic chunks.")
+    parser.add_argument("era", type=str, choices=list(GOLDEN_JSONS), help="Campaign of the synthetic events.")
+    parser.add_argument("--scenarios", type=str, nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS), help="Scenarios to run.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000], help="Chunk sizes in events.")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per point; the median time is reported.")
+    parser.add_argument("--seed", type=int, default=12345, help="Random seed of the synthetic events.")
+    parser.add_argument("--preload", action="store_true", help="Run WrAnalysis with preload=True.")
+    parser.add_argument("--cache-dir", type=str, default="synthetic_nanoaod/bench", help="Directory for the synthetic input files.")
+    parser.add_argument("--output", type=str, default=None, help="Results file (default: benchmarks/process_<era>_<commit>_<timestamp>.json).")
+    parser.add_argument("--compare", type=str, nargs="+", metavar="RESULTS", default=None,
+                        help="Compare with an earlier results file; with two files, only compare them with each other.")
+    args = parser.parse_args()
+
+    if args.compare and len(args.compare) > 2:
+        parser.error("--compare takes one or two results files.")
+    if args.compare and len(args.compare) == 2:
+        compare(load_results(args.compare[0]), load_results(args.compare[1]))
+        return
+
+    cache_dir = Path(args.cache_dir).resolve()
+    max_size = max(args.sizes)
+    commit = git_commit()
+
+    results = []
+    for scenario in args.scenarios:
+        path = input_file(cache_dir, args.era, scenario, max_size, args.seed)
+        sf_path = sf_file(cache_dir) if SCENARIOS[scenario].get("sf") else None
+        for size in sorted(args.sizes):
+            logging.info(f"Benchmarking {scenario} with {size} events")
+            results.append(run_point(args.era, scenario, path, size, args.repeats, sf_path, args.preload))
+
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "era": args.era,
+        "seed": args.seed,
+        "repeats": args.repeats,
+        "preload": args.preload,
+        "host": {"python": platform.python_version(), "machine": platform.machine(), "cpus": multiprocessing.cpu_count()},
+        "results": results,
+    }
+
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    output = Path(args.output or f"benchmarks/process_{args.era}_{commit}_{stamp}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=1)
+    logging.info(f"Results saved to {output}")
+
+    print_results(results)
+    if args.compare:
+        print()
+        compare(load_results(args.compare[0]), report)
+
+if __name__ == "__main__":
+    main()
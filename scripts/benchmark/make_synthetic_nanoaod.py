@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+#
+# -----------------------------------------------------------------------------
+# Writes local NanoAOD-like ROOT files with the branches read by WrAnalysis and
+# scripts/setup/skims/skim_files.py, and a matching fileset JSON, so the
+# analyzer can be run and benchmarked without EOS access or a grid proxy.
+#
+# Example usage:
+#   python3 scripts/benchmark/make_synthetic_nanoaod.py Run3Summer22 DYJets --events 500000 --files 4
+#   python3 scripts/benchmark/make_synthetic_nanoaod.py Run3Summer22 EGamma --events 1000000
+#   python3 scripts/benchmark/make_synthetic_nanoaod.py Run3Summer22 Signal --mass WR4000_N2100 --events 50000
+#
+# Output:
+#   synthetic_nanoaod/Run3Summer22/DYJets/DYJets_0.root, ...
+#   data/jsons/Run3/2022/Run3Summer22/synthetic/Run3Summer22_DYJets_synthetic_fileset.json
+# -----------------------------------------------------------------------------
+import argparse
+import json
+import logging
+import sys
+from pathlib import Path
+
+import awkward as ak
+import numpy as np
+import uproot
+
+repo_root = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(repo_root))
+sys.path.insert(0, str(repo_root / "src"))
+
+from analyzer import EVENT_COLUMNS, MC_COLUMNS, OBJECT_COLUMNS, get_hlt_paths
+from lumi_mask import GOLDEN_JSONS
+from python.preprocess_utils import get_era_details
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+DATA_SAMPLES = ["EGamma", "Muon"]
+
+# Mean multiplicity and pT spectrum (minimum + exponential tail, in GeV) per collection.
+# Signal spectra are harder, so that the resolved and boosted regions get populated.
+PROFILES = {
+    "background": {
+        "Electron": {"mean": 1.0, "min_pt": 10, "scale": 45},
+        "Muon":     {"mean": 1.0, "min_pt": 10, "scale": 45},
+        "Jet":      {"mean": 4.0, "min_pt": 25, "scale": 60},
+        "FatJet":   {"mean": 0.6, "min_pt": 170, "scale": 120},
+    },
+    "signal": {
+        "Electron": {"mean": 1.2, "min_pt": 10, "scale": 400},
+        "Muon":     {"mean": 1.2, "min_pt": 10, "scale": 400},
+        "Jet":      {"mean": 4.0, "min_pt": 25, "scale": 350},
+        "FatJet":   {"mean": 1.0, "min_pt": 170, "scale": 600},
+    },
+}
+
+# Offline pT threshold above which each trigger path fires
+HLT_THRESHOLDS = {
+    "Ele32_WPTight_Gsf": ("Electron", 35), "Photon200": ("Electron", 200), "Ele115_CaloIdVT_GsfTrkIdT": ("Electron", 120),
+    "Mu50": ("Muon", 52), "OldMu100": ("Muon", 102), "TkMu100": ("Muon", 102), "HighPtTkMu100": ("Muon", 102),
+}
+
+def make_collection(rng, name, n_events, profile):
+    """Kinematics and identification branches of one collection, as a jagged record array."""
+    counts = rng.poisson(profile["mean"], n_events)
+    total = int(counts.sum())
+    pt = (profile["min_pt"] + rng.exponential(profile["scale"], total)).astype(np.float32)
+
+    fields = {
+        "pt": pt,
+        "eta": rng.uniform(-2.6, 2.6, total).astype(np.float32),
+        "phi": rng.uniform(-np.pi, np.pi, total).astype(np.float32),
+    }
+    if name == "Electron":
+        fields["mass"] = np.full(total, 0.000511, dtype=np.float32)
+        fields["charge"] = rng.choice(np.array([-1, 1], dtype=np.int32), total)
+        fields["cutBased"] = rng.choice(np.arange(5, dtype=np.uint8), total, p=[0.1, 0.1, 0.1, 0.2, 0.5])
+        fields["cutBased_HEEP"] = rng.random(total) < 0.8
+    elif name == "Muon":
+        fields["mass"] = np.full(total, 0.10566, dtype=np.float32)
+        fields["charge"] = rng.choice(np.array([-1, 1], dtype=np.int32), total)
+        fields["highPtId"] = rng.choice(np.arange(3, dtype=np.uint8), total, p=[0.1, 0.1, 0.8])
+        fields["tkRelIso"] = rng.exponential(0.05, total).astype(np.float32)
+    elif name == "Jet":
+        fields["mass"] = (pt * rng.uniform(0.05, 0.2, total)).astype(np.float32)
+        fields["jetId"] = rng.choice(np.array([0, 2, 6], dtype=np.uint8), total, p=[0.05, 0.05, 0.9])
+    elif name == "FatJet":
+        mass = rng.normal(90, 40, total).clip(5, None).astype(np.float32)
+        fields["mass"] = mass
+        fields["msoftdrop"] = (mass * rng.uniform(0.6, 1.0, total)).astype(np.float32)
+        fields["jetId"] = rng.choice(np.array([0, 2, 6], dtype=np.uint8), total, p=[0.05, 0.05, 0.9])
+        fields["lsf3"] = rng.uniform(0, 1, total).astype(np.float32)
+
+    # Every field the analyzer reads must be there
+    missing = set(OBJECT_COLUMNS[name]) - set(fields)
+    if missing:
+        raise KeyError(f"No generator for {name} fields {sorted(missing)}")
+
+    # NanoAOD collections are pT ordered within each event
+    order = np.lexsort((-pt, np.repeat(np.arange(n_events), counts)))
+    return ak.zip({field: ak.unflatten(values[order], counts) for field, values in fields.items()})
+
+def certified_lumis(era, rng, n_events):
+    """Run and lumi section numbers drawn from the certified ranges of the era's golden JSON."""
+    with open(GOLDEN_JSONS[era]) as f:
+        golden = json.load(f)
+    pairs = np.array([(int(run), lumi) for run, ranges in golden.items() for start, stop in ranges for lumi in range(start, stop + 1)])
+    picks = pairs[rng.integers(0, len(pairs), n_events)]
+    return picks[:, 0].astype(np.uint32), picks[:, 1].astype(np.uint32)
+
+def make_events(rng, era, n_events, is_data, profile, first_event):
+    events = {name: make_collection(rng, name, n_events, PROFILES[profile][name]) for name in OBJECT_COLUMNS}
+
+    hlt_paths = get_hlt_paths(era)
+    for path in hlt_paths["e"] + hlt_paths["mu"]:
+        collection, threshold = HLT_THRESHOLDS[path]
+        events[f"HLT_{path}"] = ak.to_numpy(ak.any(events[collection].pt > threshold, axis=1))
+
+    events["event"] = np.arange(first_event, first_event + n_events, dtype=np.uint64)
+    if is_data:
+        events["run"], events["luminosityBlock"] = certified_lumis(era, rng, n_events)
+    else:
+        events["run"] = np.ones(n_events, dtype=np.uint32)
+        events["luminosityBlock"] = (events["event"] // 1000 + 1).astype(np.uint32)
+        # LO-like generator weights with a small negative fraction
+        events["genWeight"] = np.where(rng.random(n_events) < 0.02, -1.0, 1.0).astype(np.float32)
+
+    expected = set(EVENT_COLUMNS) | (set() if is_data else set(MC_COLUMNS))
+    missing = expected - set(events)
+    if missing:
+        raise KeyError(f"No generator for event branches {sorted(missing)}")
+    return events
+
+def write_file(path, rng, era, n_events, is_data, profile, first_event, basket_size=100_000):
+    """Write one file in baskets of basket_size events; returns the sum of generator weights."""
+    sumw = 0.0
+    with uproot.recreate(path) as f:
+        for start in range(0, n_events, basket_size):
+            size = min(basket_size, n_events - start)
+            events = make_events(rng, era, size, is_data, profile, first_event + start)
+            if "Events" in f:
+                f["Events"].extend(events)
+            else:
+                f["Events"] = events
+            if not is_data:
+                sumw += float(np.sum(events["genWeight"]))
+
+        if not is_data:
+            f["Runs"] = {
+                "run": np.array([1], dtype=np.uint32),
+                "genEventCount": np.array([n_events], dtype=np.int64),
+                "genEventSumw": np.array([sumw], dtype=np.float64),
+                "genEventSumw2": np.array([float(n_events)], dtype=np.float64),
+            }
+    return sumw
+
+def main():
+    parser = argparse.ArgumentParser(description="Write synthetic NanoAOD-like files and their fileset JSON.")
+    parser.add_argument("era", type=str, choices=list(GOLDEN_JSONS), help="Campaign to emulate.")
+    parser.add_argument("sample", type=str, help="Physics group of the sample (e.g. DYJets, EGamma, Signal).")
+    parser.add_argument("--events", type=int, default=100_000, help="Total number of events.")
+    parser.add_argument("--files", type=int, default=1, help="Number of files the events are split into.")
+    parser.add_argument("--mass", type=str, default="WR4000_N2100", help="Mass point in the sample name of a Signal sample.")
+    parser.add_argument("--xsec", type=float, default=1.0, help="Cross section stored in the fileset metadata (pb).")
+    parser.add_argument("--seed", type=int, default=12345, help="Random seed; the same seed gives the same files.")
+    parser.add_argument("--output-dir", type=str, default="synthetic_nanoaod", help="Directory for the ROOT files.")
+    args = parser.parse_args()
+
+    run, year, era = get_era_details(args.era)
+    is_data = args.sample in DATA_SAMPLES
+    profile = "signal" if args.sample == "Signal" else "background"
+    sample_name = f"WRtoNLtoLLJJ_M{args.mass}_synthetic" if args.sample == "Signal" else f"{args.sample}_synthetic"
+
+    rng = np.random.default_rng(args.seed)
+    output_dir = (Path(args.output_dir) / era / args.sample).resolve()
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    files = {}
+    sumw = 0.0
+    per_file = -(-args.events // args.files)
+    for i in range(args.files):
+        n_events = min(per_file, args.events - i * per_file)
+        if n_events <= 0:
+            break
+        path = output_dir / f"{args.sample}_{i}.root"
+        sumw += write_file(path, rng, era, n_events, is_data, profile, first_event=i * per_file + 1)
+        files[str(path)] = "Events"
+        logging.info(f"Wrote {n_events} events to {path}")
+
+    metadata = {"run": run, "year": year, "era": era, "sample": sample_name, "physics_group": args.sample,
+                "datatype": "data" if is_data else "mc"}
+    if not is_data:
+        metadata.update({"xsec": args.xsec, "nevts": sumw})
+    fileset = {sample_name: {"files": files, "metadata": metadata}}
+
+    fileset_path = repo_root / "data" / "jsons" / run / year / era / "synthetic" / f"{era}_{args.sample}_synthetic_fileset.json"
+    fileset_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(fileset_path, "w") as f:
+        json.dump(fileset, f, indent=4)
+    logging.info(f"Fileset saved to {fileset_path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+#
+# -----------------------------------------------------------------------------
+# Example usage:
+#   # Compare two performance reports written by bin/run_analysis.py
+#   python3 scripts/compare_metrics.py metrics/Run3Summer22_DYJets_20250101_120000.json metrics/Run3Summer22_DYJets_20250102_120000.json
+# -----------------------------------------------------------------------------
+import argparse
+import sys
+from pathlib import Path
+
+repo_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(repo_root))
+
+from python.metrics import load_report
+
+TOTALS = [
+    ("wall_time",             "Wall time [s]"),
+    ("events",                "Events"),
+    ("chunks",                "Chunks"),
+    ("events_per_second",     "Events/s (wall)"),
+    ("events_per_cpu_second", "Events/s (process time)"),
+    ("processtime",           "Process time [s]"),
+    ("bytesread",             "Bytes read"),
+    ("bytes_per_second",      "Bytes/s (wall)"),
+    ("n_columns",             "Columns read"),
+    ("max_workers",           "Max workers"),
+    ("transfer_bytes",        "Output bytes transferred"),
+]
+
+def totals(report):
+    values = dict(report["totals"])
+    values["wall_time"] = report["wall_time"]
+    values["max_workers"] = max((n for _, n in report["workers"]), default=None)
+    values["transfer_bytes"] = (report.get("transfer") or {}).get("bytes")
+    return values
+
+def stage_totals(report):
+    stages = {}
+    for timings in report.get("stage_timing", {}).values():
+        for stage, seconds in timings.items():
+            stages[stage] = stages.get(stage, 0.0) + seconds
+    return stages
+
+def fmt(value):
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return f"{value:.4g}"
+    return str(value)
+
+def ratio(a, b):
+    return f"{b / a:.2f}x" if a and b is not None else "-"
+
+def print_row(label, a, b, width):
+    print(f"{label:<{width}} {fmt(a):>14} {fmt(b):>14} {ratio(a, b):>8}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two run_analysis.py performance reports.")
+    parser.add_argument("reference", type=str, help="Reference report (JSON).")
+    parser.add_argument("other", type=str, help="Report to compare with the reference (JSON).")
+    args = parser.parse_args()
+
+    ref = load_report(args.reference)
+    other = load_report(args.other)
+
+    width = 28
+    print(f"{'':<{width}} {'reference':>14} {'other':>14} {'ratio':>8}")
+    ref_totals, other_totals = totals(ref), totals(other)
+    for key, label in TOTALS:
+        print_row(label, ref_totals.get(key), other_totals.get(key), width)
+
+    # Columns are usually the first thing to check when the bytes read change
+    added = sorted(set(other["totals"]["columns"]) - set(ref["totals"]["columns"]))
+    removed = sorted(set(ref["totals"]["columns"]) - set(other["totals"]["columns"]))
+    if added:
+        print(f"\nColumns only read in other: {', '.join(added)}")
+    if removed:
+        print(f"\nColumns only read in reference: {', '.join(removed)}")
+
+    print(f"\n{'Events/s per dataset':<{width}} {'reference':>14} {'other':>14} {'ratio':>8}")
+    for dataset in sorted(set(ref["datasets"]) | set(other["datasets"])):
+        a = ref["datasets"].get(dataset, {}).get("events_per_second")
+        b = other["datasets"].get(dataset, {}).get("events_per_second")
+        print_row(dataset[:width], a, b, width)
+
+    # Per-stage timings, summed over datasets, when both runs used --profile-stages
+    ref_stages, other_stages = stage_totals(ref), stage_totals(other)
+    if ref_stages and other_stages:
+        print(f"\n{'Stage time [s]':<{width}} {'reference':>14} {'other':>14} {'ratio':>8}")
+        for stage in dict.fromkeys(list(ref_stages) + list(other_stages)):
+            print_row(stage, ref_stages.get(stage), other_stages.get(stage), width)
+
+if __name__ == "__main__":
+    main()
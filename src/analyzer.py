@@ -1,15 +1,24 @@
 from coffea import processor
 from coffea.analysis_tools import Weights, PackedSelection
-from coffea.lumi_tools import LumiMask
 from coffea.lookup_tools.dense_lookup import dense_lookup
+from coffea.nanoevents.methods import nanoaod
 import awkward as ak
 import hist
+import uproot
 import numpy as np
 import os
 import re
 import logging
 import warnings
 import json
+import threading
+from collections import OrderedDict
+from functools import partial
+
+from lumi_mask import get_lumi_mask
+from regions import load_regions, SelectionTree, DEFAULT_REGIONS_FILE
+from sparse_hist import SparseHist
+from stage_timing import StageTimer
 
 warnings.filterwarnings("ignore", module="coffea.*")
 logging.basicConfig(level=logging.INFO)
@@ -32,85 +41,266 @@ def _minimal_repeated_unit(s: str) -> str:
     return s  # fallback
 
 
-class WrAnalysis(processor.ProcessorABC):
-    def __init__(self, mass_point, sf_file=None):
-        self._signal_sample = mass_point
-
-        self.make_output = lambda: {
-            'pt_leading_lepton':        self.create_hist('pt_leadlep',        'process', 'region', (200,   0, 2000), r'$p_{T}$ of the leading lepton [GeV]'),
-            'eta_leading_lepton':       self.create_hist('eta_leadlep',       'process', 'region', (60,   -3,    3), r'$\eta$ of the leading lepton'),
-            'phi_leading_lepton':       self.create_hist('phi_leadlep',       'process', 'region', (80,   -4,    4), r'$\phi$ of the leading lepton'),
-
-            'pt_subleading_lepton':     self.create_hist('pt_subleadlep',     'process', 'region', (200,   0, 2000), r'$p_{T}$ of the subleading lepton [GeV]'),
-            'eta_subleading_lepton':    self.create_hist('eta_subleadlep',    'process', 'region', (60,   -3,    3), r'$\eta$ of the subleading lepton'),
-            'phi_subleading_lepton':    self.create_hist('phi_subleadlep',    'process', 'region', (80,   -4,    4), r'$\phi$ of the subleading lepton'),
+# NanoAOD columns read by the analyzer, per collection
+OBJECT_COLUMNS = {
+    "Electron": ["pt", "eta", "phi", "mass", "charge", "cutBased", "cutBased_HEEP"],
+    "Muon":     ["pt", "eta", "phi", "mass", "charge", "highPtId", "tkRelIso"],
+    "Jet":      ["pt", "eta", "phi", "mass", "jetId"],
+    "FatJet":   ["pt", "eta", "phi", "mass", "msoftdrop", "jetId", "lsf3"],
+}
+EVENT_COLUMNS = ["event", "run", "luminosityBlock"]
+MC_COLUMNS = ["genWeight"]
+
+# Histograms of object multiplicities only; on data they are filled as plain Int64 counts
+COUNT_HISTOGRAMS = {
+    "count", "nAK8Jets", "nAK4Jets",
+    "ntightLeptons", "nlooseLeptons", "ntightElectrons", "nlooseElectrons", "ntightMuons", "nlooseMuons",
+    "nAK8vsnAK4", "nAK8vsntightLeptons", "nAK8vsnlooseLeptons", "nAK8vsntightElectrons", "nAK8vsnlooseElectrons",
+    "nAK8vsntightMuons", "nAK8vsnlooseMuons",
+    "nAK4vsntightLeptons", "nAK4vsnlooseLeptons", "nAK4vsntightElectrons", "nAK4vsnlooseElectrons",
+    "nAK4vsntightMuons", "nAK4vsnlooseMuons", "nloosevsntightLeptons",
+}
+
+RUN2_ERAS = ("RunIISummer20UL18", "Run2Autumn18")
+RUN3_ERAS = ("Run3Summer22", "Run3Summer23BPix", "Run3Summer22EE", "Run3Summer23")
+
+# Electron and muon trigger paths, OR-ed together
+HLT_PATHS = {
+    "RunII": {
+        "e":  ["Ele32_WPTight_Gsf", "Photon200", "Ele115_CaloIdVT_GsfTrkIdT"],
+        "mu": ["Mu50", "OldMu100", "TkMu100"],
+    },
+    "Run3": {
+        "e":  ["Ele32_WPTight_Gsf", "Photon200", "Ele115_CaloIdVT_GsfTrkIdT"],
+        "mu": ["Mu50", "HighPtTkMu100"],
+    },
+}
+
+
+def get_hlt_paths(era):
+    if era in RUN2_ERAS:
+        return HLT_PATHS["RunII"]
+    elif era in RUN3_ERAS:
+        return HLT_PATHS["Run3"]
+    return {"e": [], "mu": []}
+
+
+# (histogram name, kinematics key, histogram axis name) filled in each region family.
+# 2D entries carry a tuple of keys and a tuple of axis names.
+RESOLVED_VARIABLES = [
+    ('pt_leading_lepton',           'pt_leadlep',                  'pt_leadlep'),
+    ('eta_leading_lepton',          'eta_leadlep',                 'eta_leadlep'),
+    ('phi_leading_lepton',          'phi_leadlep',                 'phi_leadlep'),
+    ('pt_subleading_lepton',        'pt_subleadlep',               'pt_subleadlep'),
+    ('eta_subleading_lepton',       'eta_subleadlep',              'eta_subleadlep'),
+    ('phi_subleading_lepton',       'phi_subleadlep',              'phi_subleadlep'),
+    ('pt_leading_jet',              'pt_leadjet',                  'pt_leadjet'),
+    ('eta_leading_jet',             'eta_leadjet',                 'eta_leadjet'),
+    ('phi_leading_jet',             'phi_leadjet',                 'phi_leadjet'),
+    ('pt_subleading_jet',           'pt_subleadjet',               'pt_subleadjet'),
+    ('eta_subleading_jet',          'eta_subleadjet',              'eta_subleadjet'),
+    ('phi_subleading_jet',          'phi_subleadjet',              'phi_subleadjet'),
+    ('mass_dilepton',               'mass_dilepton',               'mass_dilepton'),
+    ('pt_dilepton',                 'pt_dilepton',                 'pt_dilepton'),
+    ('mass_dijet',                  'mass_dijet',                  'mass_dijet'),
+    ('pt_dijet',                    'pt_dijet',                    'pt_dijet'),
+    ('mass_threeobject_leadlep',    'mass_threeobject_leadlep',    'mass_threeobject_leadlep'),
+    ('pt_threeobject_leadlep',      'pt_threeobject_leadlep',      'pt_threeobject_leadlep'),
+    ('mass_threeobject_subleadlep', 'mass_threeobject_subleadlep', 'mass_threeobject_subleadlep'),
+    ('pt_threeobject_subleadlep',   'pt_threeobject_subleadlep',   'pt_threeobject_subleadlep'),
+    ('mass_fourobject',             'mass_fourobject',             'mass_fourobject'),
+    ('pt_fourobject',               'pt_fourobject',               'pt_fourobject'),
+]
+
+BOOSTED_VARIABLES = [
+    ('pt_leading_lepton',               'pt_leadlep',                'pt_leadlep'),
+    ('eta_leading_lepton',              'eta_leadlep',               'eta_leadlep'),
+    ('phi_leading_lepton',              'phi_leadlep',               'phi_leadlep'),
+    ('pt_leading_loose_lepton',         'pt_leadlooselep',           'pt_leadlooselep'),
+    ('eta_leading_loose_lepton',        'eta_leadlooselep',          'eta_leadlooselep'),
+    ('phi_leading_loose_lepton',        'phi_leadlooselep',          'phi_leadlooselep'),
+    ('pt_leading_AK8Jets',              'pt_leadAK8Jets',            'pt_leadAK8Jets'),
+    ('eta_leading_AK8Jets',             'eta_leadAK8Jets',           'eta_leadAK8Jets'),
+    ('phi_leading_AK8Jets',             'phi_leadAK8Jets',           'phi_leadAK8Jets'),
+    ('mass_dilepton',                   'mass_dilepton_boosted',     'mass_dilepton'),
+    ('pt_dilepton',                     'pt_dilepton_boosted',       'pt_dilepton'),
+    ('mass_twoobject',                  'mass_twoobject',            'mass_twoobject'),
+    ('pt_twoobject',                    'pt_twoobject',              'pt_twoobject'),
+    ('LSF_leading_AK8Jets',             'LSF_leadingAK8Jets',        'LSF_leadingAK8Jets'),
+    ('dPhi_leading_tightlepton_AK8Jet', 'dPhi_leadTightlep_AK8Jets', 'dPhi_leadTightlep_AK8Jets'),
+]
+
+CHECK_REGION_VARIABLES = [
+    ('count',           'count',           'count'),
+    ('nAK8Jets',        'nAK8Jets',        'nAK8Jets'),
+    ('nAK4Jets',        'nAK4Jets',        'nAK4Jets'),
+    ('ntightLeptons',   'ntightLeptons',   'ntightLeptons'),
+    ('nlooseLeptons',   'nlooseLeptons',   'nlooseLeptons'),
+    ('nlooseElectrons', 'nlooseElectrons', 'nlooseElectrons'),
+    ('nlooseMuons',     'nlooseMuons',     'nlooseMuons'),
+    ('ntightElectrons', 'ntightElectrons', 'ntightElectrons'),
+    ('ntightMuons',     'ntightMuons',     'ntightMuons'),
+
+    ('nAK8vsnAK4',            ('nAK8Jets', 'nAK4Jets'),             ('nAK8', 'nAK4')),
+    ('nAK8vsntightLeptons',   ('nAK8Jets', 'ntightLeptons'),        ('nAK8', 'ntightLeptons')),
+    ('nAK8vsnlooseLeptons',   ('nAK8Jets', 'nlooseLeptons'),        ('nAK8', 'nlooseLeptons')),
+    ('nAK8vsntightElectrons', ('nAK8Jets', 'ntightElectrons'),      ('nAK8', 'ntightElectrons')),
+    ('nAK8vsnlooseElectrons', ('nAK8Jets', 'nlooseElectrons'),      ('nAK8', 'nlooseElectrons')),
+    ('nAK8vsntightMuons',     ('nAK8Jets', 'ntightMuons'),          ('nAK8', 'ntightMuons')),
+    ('nAK8vsnlooseMuons',     ('nAK8Jets', 'nlooseMuons'),          ('nAK8', 'nlooseMuons')),
+    ('nAK4vsntightLeptons',   ('nAK4Jets', 'ntightLeptons'),        ('nAK4', 'ntightLeptons')),
+    ('nAK4vsnlooseLeptons',   ('nAK4Jets', 'nlooseLeptons'),        ('nAK4', 'nlooseLeptons')),
+    ('nAK4vsntightElectrons', ('nAK4Jets', 'ntightElectrons'),      ('nAK4', 'ntightElectrons')),
+    ('nAK4vsnlooseElectrons', ('nAK4Jets', 'nlooseElectrons'),      ('nAK4', 'nlooseElectrons')),
+    ('nAK4vsntightMuons',     ('nAK4Jets', 'ntightMuons'),          ('nAK4', 'ntightMuons')),
+    ('nAK4vsnlooseMuons',     ('nAK4Jets', 'nlooseMuons'),          ('nAK4', 'nlooseMuons')),
+    ('nloosevsntightLeptons', ('nlooseLeptons', 'ntightLeptons'),   ('nlooseLeptons', 'ntightLeptons')),
+]
+
+FAMILY_VARIABLES = {
+    "resolved": RESOLVED_VARIABLES,
+    "boosted":  BOOSTED_VARIABLES,
+    "check":    CHECK_REGION_VARIABLES,
+}
+
+
+class RegionSelection:
+    """
+    PackedSelection of a chunk together with its nominal event weight.
+    Region masks come from the compiled selection tree; selected indices and masked
+    weights are computed once and shared by every histogram filled in that region.
+    """
+    def __init__(self, selections, weight, tree, region_weights=None):
+        self.selections = selections
+        self.weight = weight
+        self.tree = tree
+        self.node_masks = tree.evaluate(selections)
+        self._region_weights = region_weights or {}
+        self._indices = {}
+        self._weights = {}
+
+    def mask(self, region):
+        return self.node_masks[self.tree.region_nodes[region][-1]]
+
+    def indices(self, region):
+        if region not in self._indices:
+            self._indices[region] = np.flatnonzero(self.mask(region))
+        return self._indices[region]
+
+    def region_weight(self, region):
+        """Event weight of the selected events in a region, including region-specific corrections."""
+        if region not in self._weights:
+            weight = self._region_weights.get(region, self.weight)
+            self._weights[region] = weight[self.indices(region)]
+        return self._weights[region]
+
+
+# Files opened by preload_events in this worker process, most recently used last. Consecutive
+# chunks of a file reuse the handle instead of repeating the XRootD handshake.
+MAX_OPEN_FILES = 4
+_open_files = OrderedDict()
+_open_files_lock = threading.Lock()
+
+def open_tree(filename, treename, timeout):
+    with _open_files_lock:
+        if filename in _open_files:
+            _open_files.move_to_end(filename)
+        else:
+            _open_files[filename] = uproot.open(filename, timeout=timeout)
+            while len(_open_files) > MAX_OPEN_FILES:
+                _, oldest = _open_files.popitem(last=False)
+                oldest.close()
+        return _open_files[filename][treename]
 
-            'pt_leading_jet':           self.create_hist('pt_leadjet',           'process', 'region', (200,   0, 2000), r'$p_{T}$ of the leading jet [GeV]'),
-            'eta_leading_jet':          self.create_hist('eta_leadjet',          'process', 'region', (60,   -3,    3), r'$\eta$ of the leading jet'),
-            'phi_leading_jet':          self.create_hist('phi_leadjet',          'process', 'region', (80,   -4,    4), r'$\phi$ of the leading jet'),
 
-            'pt_subleading_jet':        self.create_hist('pt_subleadjet',        'process', 'region', (200,   0, 2000), r'$p_{T}$ of the subleading jet [GeV]'),
-            'eta_subleading_jet':       self.create_hist('eta_subleadjet',       'process', 'region', (60,   -3,    3), r'$\eta$ of the subleading jet'),
-            'phi_subleading_jet':       self.create_hist('phi_subleadjet',       'process', 'region', (80,   -4,    4), r'$\phi$ of the subleading jet'),
+class WrAnalysis(processor.ProcessorABC):
+    def __init__(self, mass_point, sf_file=None, batch_fill=True, lumi_eras=(), preload=False, xrootdtimeout=60, regions_file=None, profile_stages=False):
+        self._signal_sample = mass_point
 
-            'mass_dilepton':            self.create_hist('mass_dilepton',            'process', 'region', (5000,  0, 5000), r'$m_{\ell\ell}$ [GeV]'),
-            'pt_dilepton':              self.create_hist('pt_dilepton',              'process', 'region', (200,   0, 2000), r'$p_{T,\ell\ell}$ [GeV]'),
+        # Regions are read here and travel with the processor; workers only see the compiled tree
+        self._regions = load_regions(regions_file or DEFAULT_REGIONS_FILE)
+        self._selection_tree = SelectionTree({region: d["cuts"] for region, d in self._regions.items()})
+        self._batch_fill = batch_fill
+        self._preload = preload
+        self._profile_stages = profile_stages
+        self._xrootdtimeout = xrootdtimeout
+
+        # Lumi masks serialized with the processor, so workers never read the golden JSON
+        self._lumi_masks = {era: get_lumi_mask(era) for era in lumi_eras}
+
+        # Histograms are only created on their first non-empty fill (see get_hist)
+        self.hist_factories = {
+            'pt_leading_lepton':        partial(self.create_hist, 'pt_leadlep',        'process', 'region', (200,   0, 2000), r'$p_{T}$ of the leading lepton [GeV]'),
+            'eta_leading_lepton':       partial(self.create_hist, 'eta_leadlep',       'process', 'region', (60,   -3,    3), r'$\eta$ of the leading lepton'),
+            'phi_leading_lepton':       partial(self.create_hist, 'phi_leadlep',       'process', 'region', (80,   -4,    4), r'$\phi$ of the leading lepton'),
+
+            'pt_subleading_lepton':     partial(self.create_hist, 'pt_subleadlep',     'process', 'region', (200,   0, 2000), r'$p_{T}$ of the subleading lepton [GeV]'),
+            'eta_subleading_lepton':    partial(self.create_hist, 'eta_subleadlep',    'process', 'region', (60,   -3,    3), r'$\eta$ of the subleading lepton'),
+            'phi_subleading_lepton':    partial(self.create_hist, 'phi_subleadlep',    'process', 'region', (80,   -4,    4), r'$\phi$ of the subleading lepton'),
+
+            'pt_leading_jet':           partial(self.create_hist, 'pt_leadjet',           'process', 'region', (200,   0, 2000), r'$p_{T}$ of the leading jet [GeV]'),
+            'eta_leading_jet':          partial(self.create_hist, 'eta_leadjet',          'process', 'region', (60,   -3,    3), r'$\eta$ of the leading jet'),
+            'phi_leading_jet':          partial(self.create_hist, 'phi_leadjet',          'process', 'region', (80,   -4,    4), r'$\phi$ of the leading jet'),
+
+            'pt_subleading_jet':        partial(self.create_hist, 'pt_subleadjet',        'process', 'region', (200,   0, 2000), r'$p_{T}$ of the subleading jet [GeV]'),
+            'eta_subleading_jet':       partial(self.create_hist, 'eta_subleadjet',       'process', 'region', (60,   -3,    3), r'$\eta$ of the subleading jet'),
+            'phi_subleading_jet':       partial(self.create_hist, 'phi_subleadjet',       'process', 'region', (80,   -4,    4), r'$\phi$ of the subleading jet'),
+
+            'mass_dilepton':            partial(self.create_hist, 'mass_dilepton',            'process', 'region', (5000,  0, 5000), r'$m_{\ell\ell}$ [GeV]', sparse=True),
+            'pt_dilepton':              partial(self.create_hist, 'pt_dilepton',              'process', 'region', (200,   0, 2000), r'$p_{T,\ell\ell}$ [GeV]'),
  
-            'mass_dijet':               self.create_hist('mass_dijet',               'process', 'region', (500,   0, 5000), r'$m_{jj}$ [GeV]'),
-            'pt_dijet':                 self.create_hist('pt_dijet',                 'process', 'region', (500,   0, 5000), r'$p_{T,jj}$ [GeV]'),
+            'mass_dijet':               partial(self.create_hist, 'mass_dijet',               'process', 'region', (500,   0, 5000), r'$m_{jj}$ [GeV]'),
+            'pt_dijet':                 partial(self.create_hist, 'pt_dijet',                 'process', 'region', (500,   0, 5000), r'$p_{T,jj}$ [GeV]'),
 
-            'mass_threeobject_leadlep':  self.create_hist('mass_threeobject_leadlep',  'process', 'region', (800,   0, 8000), r'$m_{\ell jj}$ [GeV]'),
-            'pt_threeobject_leadlep':    self.create_hist('pt_threeobject_leadlep',    'process', 'region', (800,   0, 8000), r'$p_{T,\ell jj}$ [GeV]'),
+            'mass_threeobject_leadlep':  partial(self.create_hist, 'mass_threeobject_leadlep',  'process', 'region', (800,   0, 8000), r'$m_{\ell jj}$ [GeV]'),
+            'pt_threeobject_leadlep':    partial(self.create_hist, 'pt_threeobject_leadlep',    'process', 'region', (800,   0, 8000), r'$p_{T,\ell jj}$ [GeV]'),
 
-            'mass_threeobject_subleadlep': self.create_hist('mass_threeobject_subleadlep', 'process', 'region', (800,   0, 8000), r'$m_{\ell jj}$ [GeV]'),
-            'pt_threeobject_subleadlep':   self.create_hist('pt_threeobject_subleadlep',   'process', 'region', (800,   0, 8000), r'$p_{T,\ell jj}$ [GeV]'),
+            'mass_threeobject_subleadlep': partial(self.create_hist, 'mass_threeobject_subleadlep', 'process', 'region', (800,   0, 8000), r'$m_{\ell jj}$ [GeV]'),
+            'pt_threeobject_subleadlep':   partial(self.create_hist, 'pt_threeobject_subleadlep',   'process', 'region', (800,   0, 8000), r'$p_{T,\ell jj}$ [GeV]'),
 
-            'mass_fourobject':        self.create_hist('mass_fourobject',        'process', 'region', (800,   0, 8000), r'$m_{\ell\ell jj}$ [GeV]'),
-            'pt_fourobject':          self.create_hist('pt_fourobject',          'process', 'region', (800,   0, 8000), r'$p_{T,\ell\ell jj}$ [GeV]'),
+            'mass_fourobject':        partial(self.create_hist, 'mass_fourobject',        'process', 'region', (800,   0, 8000), r'$m_{\ell\ell jj}$ [GeV]'),
+            'pt_fourobject':          partial(self.create_hist, 'pt_fourobject',          'process', 'region', (800,   0, 8000), r'$p_{T,\ell\ell jj}$ [GeV]'),
 
             ##adding histograms for boosted region
-            'pt_leading_loose_lepton':        self.create_hist('pt_leadlooselep',        'process', 'region', (200,   0, 2000), r'$p_{T}$ of the leading loose lepton [GeV]'),
-            'eta_leading_loose_lepton':       self.create_hist('eta_leadlooselep',       'process', 'region', (60,   -3,    3), r'$\eta$ of the leading loose lepton'),
-            'phi_leading_loose_lepton':       self.create_hist('phi_leadlooselep',       'process', 'region', (80,   -4,    4), r'$\phi$ of the leading loose lepton'),
-             'pt_leading_AK8Jets':        self.create_hist('pt_leadAK8Jets',        'process', 'region', (200,   0, 2000), r'$p_{T}$ of the leading  AK8Jets [GeV]'),
-            'eta_leading_AK8Jets':       self.create_hist('eta_leadAK8Jets',       'process', 'region', (60,   -3,    3), r'$\eta$ of theleading  AK8Jets'),
-            'phi_leading_AK8Jets':       self.create_hist('phi_leadAK8Jets',       'process', 'region', (80,   -4,    4), r'$\phi$ of theleading  AK8Jets'),
-            'LSF_leading_AK8Jets':        self.create_hist('LSF_leadingAK8Jets',        'process', 'region', (200,   0, 1.1), r'LSF of leading AK8Jets'),
-            'mass_twoobject':        self.create_hist('mass_twoobject',        'process', 'region', (800,   0, 8000), r'$m_{\ell\ell jj}$ [GeV]'),
-            'pt_twoobject':          self.create_hist('pt_twoobject',          'process', 'region', (800,   0, 8000), r'$p_{T,\ell\ell jj}$ [GeV]'),
-            'count' : self.create_hist('count','process', 'region', (100,0,100), r'count'),
-            'dPhi_leading_tightlepton_AK8Jet':       self.create_hist('dPhi_leadTightlep_AK8Jets',       'process', 'region', (80,   -4,    4), r'$d\phi$ (leading Tight lepton, AK8 Jet)'),
-
-            'nAK8Jets' : self.create_hist('nAK8Jets','process','region',(10,0,10),r'nAK8Jets'),
-            'nAK4Jets' : self.create_hist('nAK4Jets','process','region',(10,0,10),r'nAK4Jets'),
-            'ntightLeptons' : self.create_hist('ntightLeptons','process','region',(10,0,10),r'ntightLeptons'),
-            'nlooseLeptons' : self.create_hist('nlooseLeptons','process','region',(10,0,10),r'nlooseLeptons'),
-            'ntightElectrons' : self.create_hist('ntightElectrons','process','region',(10,0,10),r'ntightElectrons'),
-            'nlooseElectrons' : self.create_hist('nlooseElectrons','process','region',(10,0,10),r'nlooseElectrons'),
-            'ntightMuons' : self.create_hist('ntightMuons','process','region',(10,0,10),r'ntightMuons'),
-            'nlooseMuons' : self.create_hist('nlooseMuons','process','region',(10,0,10),r'nlooseMuons'),
+            'pt_leading_loose_lepton':        partial(self.create_hist, 'pt_leadlooselep',        'process', 'region', (200,   0, 2000), r'$p_{T}$ of the leading loose lepton [GeV]'),
+            'eta_leading_loose_lepton':       partial(self.create_hist, 'eta_leadlooselep',       'process', 'region', (60,   -3,    3), r'$\eta$ of the leading loose lepton'),
+            'phi_leading_loose_lepton':       partial(self.create_hist, 'phi_leadlooselep',       'process', 'region', (80,   -4,    4), r'$\phi$ of the leading loose lepton'),
+             'pt_leading_AK8Jets':        partial(self.create_hist, 'pt_leadAK8Jets',        'process', 'region', (200,   0, 2000), r'$p_{T}$ of the leading  AK8Jets [GeV]'),
+            'eta_leading_AK8Jets':       partial(self.create_hist, 'eta_leadAK8Jets',       'process', 'region', (60,   -3,    3), r'$\eta$ of theleading  AK8Jets'),
+            'phi_leading_AK8Jets':       partial(self.create_hist, 'phi_leadAK8Jets',       'process', 'region', (80,   -4,    4), r'$\phi$ of theleading  AK8Jets'),
+            'LSF_leading_AK8Jets':        partial(self.create_hist, 'LSF_leadingAK8Jets',        'process', 'region', (200,   0, 1.1), r'LSF of leading AK8Jets'),
+            'mass_twoobject':        partial(self.create_hist, 'mass_twoobject',        'process', 'region', (800,   0, 8000), r'$m_{\ell\ell jj}$ [GeV]'),
+            'pt_twoobject':          partial(self.create_hist, 'pt_twoobject',          'process', 'region', (800,   0, 8000), r'$p_{T,\ell\ell jj}$ [GeV]'),
+            'count' : partial(self.create_hist, 'count','process', 'region', (100,0,100), r'count'),
+            'dPhi_leading_tightlepton_AK8Jet':       partial(self.create_hist, 'dPhi_leadTightlep_AK8Jets',       'process', 'region', (80,   -4,    4), r'$d\phi$ (leading Tight lepton, AK8 Jet)'),
+
+            'nAK8Jets' : partial(self.create_hist, 'nAK8Jets','process','region',(10,0,10),r'nAK8Jets'),
+            'nAK4Jets' : partial(self.create_hist, 'nAK4Jets','process','region',(10,0,10),r'nAK4Jets'),
+            'ntightLeptons' : partial(self.create_hist, 'ntightLeptons','process','region',(10,0,10),r'ntightLeptons'),
+            'nlooseLeptons' : partial(self.create_hist, 'nlooseLeptons','process','region',(10,0,10),r'nlooseLeptons'),
+            'ntightElectrons' : partial(self.create_hist, 'ntightElectrons','process','region',(10,0,10),r'ntightElectrons'),
+            'nlooseElectrons' : partial(self.create_hist, 'nlooseElectrons','process','region',(10,0,10),r'nlooseElectrons'),
+            'ntightMuons' : partial(self.create_hist, 'ntightMuons','process','region',(10,0,10),r'ntightMuons'),
+            'nlooseMuons' : partial(self.create_hist, 'nlooseMuons','process','region',(10,0,10),r'nlooseMuons'),
             
             ## define 2D histogram to debug ---
-            'nAK8vsnAK4' : self.create_hist2D('nAK8', 'process','region',(10,0,10),r'n AK8 Jets','nAK4',(10,0,10),r'n AK4 Jets'),
-            'nAK8vsntightLeptons' : self.create_hist2D('nAK8', 'process','region',(10,0,10),r'n AK8 Jets','ntightLeptons',(10,0,10),r'ntight Leptons'),
-            'nAK8vsnlooseLeptons' : self.create_hist2D('nAK8', 'process','region',(10,0,10),r'n AK8 Jets','nlooseLeptons',(10,0,10),r'nloose Leptons'),
-            'nAK8vsntightElectrons' : self.create_hist2D('nAK8', 'process','region',(10,0,10),r'n AK8 Jets','ntightElectrons',(10,0,10),r'ntight Electrons'),
-            'nAK8vsnlooseElectrons' : self.create_hist2D('nAK8', 'process','region',(10,0,10),r'n AK8 Jets','nlooseElectrons',(10,0,10),r'nloose Electrons'),
-            'nAK8vsntightMuons' : self.create_hist2D('nAK8', 'process','region',(10,0,10),r'n AK8 Jets','ntightMuons',(10,0,10),r'ntight Muons'),
-            'nAK8vsnlooseMuons' : self.create_hist2D('nAK8', 'process','region',(10,0,10),r'n AK8 Jets','nlooseMuons',(10,0,10),r'nloose Muons'),
-
-            'nAK4vsntightLeptons' : self.create_hist2D('nAK4', 'process','region',(10,0,10),r'n AK4 Jets','ntightLeptons',(10,0,10),r'ntight Leptons'),
-            'nAK4vsnlooseLeptons' : self.create_hist2D('nAK4', 'process','region',(10,0,10),r'n AK4 Jets','nlooseLeptons',(10,0,10),r'nloose Leptons'),
-            'nAK4vsntightElectrons' : self.create_hist2D('nAK4', 'process','region',(10,0,10),r'n AK4 Jets','ntightElectrons',(10,0,10),r'ntight Electrons'),
-            'nAK4vsnlooseElectrons' : self.create_hist2D('nAK4', 'process','region',(10,0,10),r'n AK4 Jets','nlooseElectrons',(10,0,10),r'nloose Electrons'),
-            'nAK4vsntightMuons' : self.create_hist2D('nAK4', 'process','region',(10,0,10),r'n AK4 Jets','ntightMuons',(10,0,10),r'ntight Muons'),
-            'nAK4vsnlooseMuons' : self.create_hist2D('nAK4', 'process','region',(10,0,10),r'n AK4 Jets','nlooseMuons',(10,0,10),r'nloose Muons'),
-
-
-            'nloosevsntightLeptons' : self.create_hist2D('nlooseLeptons', 'process','region',(10,0,10),r'n loose Leptons','ntightLeptons',(10,0,10),r'ntight Leptons'),
-            'nAK8vsmlj' : self.create_hist2D('nAK8', 'process','region',(10,0,10),r'n AK8 Jets','mlj',(800,0,8000),r'mlj'),
-            'nAK8vsmll' : self.create_hist2D('nAK8', 'process','region',(10,0,10),r'n AK8 Jets','mll',(800,0,8000),r'mll'),
-            'mllvsmlj' : self.create_hist2D('mll', 'process','region',(800,0,8000),r'mll','mlj',(800,0,8000),r'mlj'),
+            'nAK8vsnAK4' : partial(self.create_hist2D, 'nAK8', 'process','region',(10,0,10),r'n AK8 Jets','nAK4',(10,0,10),r'n AK4 Jets'),
+            'nAK8vsntightLeptons' : partial(self.create_hist2D, 'nAK8', 'process','region',(10,0,10),r'n AK8 Jets','ntightLeptons',(10,0,10),r'ntight Leptons'),
+            'nAK8vsnlooseLeptons' : partial(self.create_hist2D, 'nAK8', 'process','region',(10,0,10),r'n AK8 Jets','nlooseLeptons',(10,0,10),r'nloose Leptons'),
+            'nAK8vsntightElectrons' : partial(self.create_hist2D, 'nAK8', 'process','region',(10,0,10),r'n AK8 Jets','ntightElectrons',(10,0,10),r'ntight Electrons'),
+            'nAK8vsnlooseElectrons' : partial(self.create_hist2D, 'nAK8', 'process','region',(10,0,10),r'n AK8 Jets','nlooseElectrons',(10,0,10),r'nloose Electrons'),
+            'nAK8vsntightMuons' : partial(self.create_hist2D, 'nAK8', 'process','region',(10,0,10),r'n AK8 Jets','ntightMuons',(10,0,10),r'ntight Muons'),
+            'nAK8vsnlooseMuons' : partial(self.create_hist2D, 'nAK8', 'process','region',(10,0,10),r'n AK8 Jets','nlooseMuons',(10,0,10),r'nloose Muons'),
+
+            'nAK4vsntightLeptons' : partial(self.create_hist2D, 'nAK4', 'process','region',(10,0,10),r'n AK4 Jets','ntightLeptons',(10,0,10),r'ntight Leptons'),
+            'nAK4vsnlooseLeptons' : partial(self.create_hist2D, 'nAK4', 'process','region',(10,0,10),r'n AK4 Jets','nlooseLeptons',(10,0,10),r'nloose Leptons'),
+            'nAK4vsntightElectrons' : partial(self.create_hist2D, 'nAK4', 'process','region',(10,0,10),r'n AK4 Jets','ntightElectrons',(10,0,10),r'ntight Electrons'),
+            'nAK4vsnlooseElectrons' : partial(self.create_hist2D, 'nAK4', 'process','region',(10,0,10),r'n AK4 Jets','nlooseElectrons',(10,0,10),r'nloose Electrons'),
+            'nAK4vsntightMuons' : partial(self.create_hist2D, 'nAK4', 'process','region',(10,0,10),r'n AK4 Jets','ntightMuons',(10,0,10),r'ntight Muons'),
+            'nAK4vsnlooseMuons' : partial(self.create_hist2D, 'nAK4', 'process','region',(10,0,10),r'n AK4 Jets','nlooseMuons',(10,0,10),r'nloose Muons'),
+
+
+            'nloosevsntightLeptons' : partial(self.create_hist2D, 'nlooseLeptons', 'process','region',(10,0,10),r'n loose Leptons','ntightLeptons',(10,0,10),r'ntight Leptons'),
 
         }
 
@@ -126,29 +316,146 @@ class WrAnalysis(processor.ProcessorABC):
 
             self.lookup_EE = dense_lookup(sf_EE, [edges])
             self.lookup_MM = dense_lookup(sf_MM, [edges])
+            self._sf_key = self.sf_kinematics_key(self.variable)
             logger.info(f"Loaded {self.variable} SF lookup from {sf_file}")
         else:
             self.variable = None
+            self._sf_key = None
             self.lookup_EE = None
             self.lookup_MM = None
 
-    def create_hist(self, name, process, region, bins, label):
-        """Helper function to create histograms."""
-        return (
+    @staticmethod
+    def columns(era, is_data):
+        """Exact list of NanoAOD branches the analyzer reads for a given era."""
+        columns = []
+        for collection, fields in OBJECT_COLUMNS.items():
+            columns.append(f"n{collection}")
+            columns += [f"{collection}_{field}" for field in fields]
+        hlt_paths = get_hlt_paths(era)
+        columns += [f"HLT_{path}" for path in hlt_paths["e"] + hlt_paths["mu"]]
+        columns += EVENT_COLUMNS
+        if not is_data:
+            columns += MC_COLUMNS
+        return columns
+
+    def preload_events(self, events):
+        """
+        Read every column of the manifest for this chunk with a single uproot call, so the
+        basket requests are coalesced instead of issued branch by branch, and rebuild the
+        collections the analyzer uses with the NanoAOD behaviors.
+        """
+        metadata = events.metadata
+        tree = open_tree(metadata["filename"], metadata["treename"], self._xrootdtimeout)
+        is_data = "genWeight" not in tree
+        columns = self.columns(metadata.get("era", ""), is_data)
+        missing = [c for c in columns if c not in tree]
+        if missing:
+            raise KeyError(f"{metadata['filename']} is missing branches required by WrAnalysis: {missing}")
+        arrays = tree.arrays(
+            columns,
+            entry_start=metadata["entrystart"],
+            entry_stop=metadata["entrystop"],
+            how=dict,
+        )
+
+        fields = {
+            collection: ak.zip(
+                {field: arrays[f"{collection}_{field}"] for field in collection_fields},
+                with_name=collection,
+                behavior=nanoaod.behavior,
+            )
+            for collection, collection_fields in OBJECT_COLUMNS.items()
+        }
+        fields["HLT"] = ak.zip({c[len("HLT_"):]: arrays[c] for c in columns if c.startswith("HLT_")})
+        for column in EVENT_COLUMNS + ([] if is_data else MC_COLUMNS):
+            fields[column] = arrays[column]
+
+        return ak.zip(fields, depth_limit=1, behavior=nanoaod.behavior)
+
+    @staticmethod
+    def any_trigger(events, paths):
+        trigger = events.HLT[paths[0]]
+        for path in paths[1:]:
+            trigger = trigger | events.HLT[path]
+        return trigger
+
+    @staticmethod
+    def hist_storage(hist_name, is_data):
+        """
+        Storage for a histogram: data events all have unit weight, so sumw2 would just repeat sumw.
+        Data uses Double storage, or Int64 for pure multiplicity histograms; MC keeps Weight.
+        """
+        if not is_data:
+            return "weight"
+        return "int64" if hist_name in COUNT_HISTOGRAMS else "double"
+
+    def get_hist(self, output, hist_name, is_data=False):
+        """Return the histogram from the chunk output, allocating it on first use."""
+        if hist_name not in output:
+            output[hist_name] = self.hist_factories[hist_name](storage=self.hist_storage(hist_name, is_data))
+        return output[hist_name]
+
+    def fill_hist(self, output, hist_name, is_data, weight, **values):
+        """Fill one histogram; Int64 histograms are only used for unit-weight data and are filled unweighted."""
+        h = self.get_hist(output, hist_name, is_data)
+        if self.hist_storage(hist_name, is_data) == "int64":
+            h.fill(**values)
+        else:
+            h.fill(**values, weight=weight)
+
+    @staticmethod
+    def with_storage(h, storage):
+        return {"weight": h.Weight, "double": h.Double, "int64": h.Int64}[storage]()
+
+    def create_hist(self, name, process, region, bins, label, sparse=False, storage="weight"):
+        """Helper function to create histograms. Sparse histograms only store occupied bins."""
+        if sparse:
+            return SparseHist([(name, bins, label)], weighted=(storage == "weight"))
+        return self.with_storage(
             hist.Hist.new.StrCat([], name="process", label="Process", growth=True)
             .StrCat([], name="region", label="Analysis Region", growth=True)
-            .Reg(*bins, name=name, label=label)
-            .Weight()
+            .Reg(*bins, name=name, label=label),
+            storage
         )
-    def create_hist2D(self, name_x, process, region, bins_x, label_x, name_y, bins_y, label_y):
+    def create_hist2D(self, name_x, process, region, bins_x, label_x, name_y, bins_y, label_y, sparse=False, storage="weight"):
         """Helper function to create 2D histograms with process & region axes."""
-        return (
+        if sparse:
+            return SparseHist([(name_x, bins_x, label_x), (name_y, bins_y, label_y)], weighted=(storage == "weight"))
+        return self.with_storage(
             hist.Hist.new.StrCat([], name="process", label="Process", growth=True)
             .StrCat([], name="region", label="Analysis Region", growth=True)
             .Reg(*bins_x, name=name_x, label=label_x)
-            .Reg(*bins_y, name=name_y, label=label_y)
-            .Weight()
+            .Reg(*bins_y, name=name_y, label=label_y),
+            storage
+        )
+
+    def create_cutflow(self, process_name, cuts, weighted=True):
+        """Helper function to create a cutflow histogram with one bin per cut."""
+        h = (
+            hist.Hist.new.StrCat([process_name], name="process", label="Process", growth=True)
+            .StrCat(list(cuts), name="cut", label="Cut", growth=True)
         )
+        return h.Weight() if weighted else h.Int64()
+
+    def fill_cutflows(self, output, process_name, selection):
+        """
+        Cumulative cutflow of every region. Each node of the selection tree is summed once,
+        and a region's cutflow is read off the nodes along its path.
+        """
+        sumw, sumw2, raw = selection.tree.node_sums(selection.node_masks, selection.weight)
+
+        for region, definition in self._regions.items():
+            path = selection.tree.region_nodes[region]
+
+            weighted = self.create_cutflow(process_name, definition["cuts"])
+            weighted.view().value[0, :] = sumw[path]
+            weighted.view().variance[0, :] = sumw2[path]
+
+            unweighted = self.create_cutflow(process_name, definition["cuts"], weighted=False)
+            unweighted.view()[0, :] = raw[path]
+
+            output["cutflow"][region] = weighted
+            output["cutflow_unweighted"][region] = unweighted
 
     def selectElectrons(self, events):
         tight_electrons = (events.Electron.pt > 53) & (np.abs(events.Electron.eta) < 2.4) & (events.Electron.cutBased_HEEP)
@@ -200,172 +507,164 @@ class WrAnalysis(processor.ProcessorABC):
         #selections.add("notResolved",~(selections.all("twoTightLeptons") & selections.all("minTwoAK4Jets") & selections.all("dr>0.4")))
         # (selections.all("nottwoTightLeptons") | selections.all("notminTwoAK4Jets") ))#| selections.all("notdr>0.4")) )#~(selections.all("twoTightLeptons") & selections.all("minTwoAK4Jets") & selections.all("dr>0.4")))
 
-    def fill_basic_histograms(self, output, region, cut, process_name, jets, leptons, ak8jets, looseleptons, leptons_all,mll_boosted,nLeptons,nElectrons, nMuons, nLooseLeptons, nLooseElectrons, nLooseMuons, nAK8Jets, nAK4Jets, weights):
-        variables =[
-            ('pt_leading_lepton',         leptons[:, 0].pt,    'pt_leadlep'),
-            ('eta_leading_lepton',        leptons[:, 0].eta,   'eta_leadlep'),
-            ('phi_leading_lepton',        leptons[:, 0].phi,   'phi_leadlep'),
-
-            ]
-        if "resolved" in region:            
-            variables = [
-                ('pt_leading_lepton',         leptons[:, 0].pt,    'pt_leadlep'),
-                ('eta_leading_lepton',        leptons[:, 0].eta,   'eta_leadlep'),
-                ('phi_leading_lepton',        leptons[:, 0].phi,   'phi_leadlep'),
-                ('pt_subleading_lepton',      leptons[:, 1].pt,    'pt_subleadlep'),
-                ('eta_subleading_lepton',     leptons[:, 1].eta,   'eta_subleadlep'),
-                ('phi_subleading_lepton',     leptons[:, 1].phi,   'phi_subleadlep'),
-                ('pt_leading_jet',            jets[:, 0].pt,       'pt_leadjet'),
-                ('eta_leading_jet',           jets[:, 0].eta,      'eta_leadjet'),
-                ('phi_leading_jet',           jets[:, 0].phi,      'phi_leadjet'),
-                ('pt_subleading_jet',         jets[:, 1].pt,       'pt_subleadjet'),
-                ('eta_subleading_jet',        jets[:, 1].eta,      'eta_subleadjet'),
-                ('phi_subleading_jet',        jets[:, 1].phi,      'phi_subleadjet'),
-                ('mass_dilepton',             (leptons[:, 0] + leptons[:, 1]).mass, 'mass_dilepton'),
-                ('pt_dilepton',               (leptons[:, 0] + leptons[:, 1]).pt,   'pt_dilepton'),
-                ('mass_dijet',                (jets[:, 0] + jets[:, 1]).mass,       'mass_dijet'),
-                ('pt_dijet',                  (jets[:, 0] + jets[:, 1]).pt,         'pt_dijet'),
-                ('mass_threeobject_leadlep',  (leptons[:, 0] + jets[:, 0] + jets[:, 1]).mass, 'mass_threeobject_leadlep'),
-                ('pt_threeobject_leadlep',    (leptons[:, 0] + jets[:, 0] + jets[:, 1]).pt,   'pt_threeobject_leadlep'),
-                ('mass_threeobject_subleadlep', (leptons[:, 1] + jets[:, 0] + jets[:, 1]).mass, 'mass_threeobject_subleadlep'),
-                ('pt_threeobject_subleadlep',  (leptons[:, 1] + jets[:, 0] + jets[:, 1]).pt,   'pt_threeobject_subleadlep'),
-                ('mass_fourobject',           (leptons[:, 0] + leptons[:, 1] + jets[:, 0] + jets[:, 1]).mass, 'mass_fourobject'),
-                ('pt_fourobject',             (leptons[:, 0] + leptons[:, 1] + jets[:, 0] + jets[:, 1]).pt,   'pt_fourobject'),
-            ]
-        elif "check_region" in region :
-            #print("im in check region")
-            variables =[
-                ('count',         leptons_all,    'count'),
-                ('nAK8Jets',nAK8Jets,'nAK8Jets'),
-                ('nAK4Jets',nAK4Jets,'nAK4Jets'),
-                ('ntightLeptons',nLeptons,'ntightLeptons'),
-                ('nAK8vsnAK4', nAK8Jets, nAK4Jets,'nAK8vsnAK4'),
-                ]
-            variables_1D = [
-                ('count', leptons_all, 'count'),
-                ('nAK8Jets', nAK8Jets, 'nAK8Jets'),
-                ('nAK4Jets', nAK4Jets, 'nAK4Jets'),
-                ('ntightLeptons', nLeptons, 'ntightLeptons'),
-                ('nlooseLeptons', nLooseLeptons, 'nlooseLeptons'),
-                ('nlooseElectrons', nLooseElectrons, 'nlooseElectrons'),
-                ('nlooseMuons', nLooseMuons, 'nlooseMuons'),
-                ('ntightElectrons', nElectrons, 'ntightElectrons'),
-                ('ntightMuons', nMuons, 'ntightMuons'),
-
-            ]
-
-            # 2D histograms
-            variables_2D = [
-                ('nAK8vsnAK4', (nAK8Jets, nAK4Jets), ('nAK8', 'nAK4')),
-                ('nAK8vsntightLeptons', (nAK8Jets, nLeptons), ('nAK8', 'ntightLeptons')),
-                ('nAK8vsnlooseLeptons', (nAK8Jets, nLooseLeptons), ('nAK8', 'nlooseLeptons')),
-                ('nAK8vsntightElectrons', (nAK8Jets, nElectrons), ('nAK8', 'ntightElectrons')),
-                ('nAK8vsnlooseElectrons', (nAK8Jets, nLooseElectrons), ('nAK8', 'nlooseElectrons')),
-                ('nAK8vsntightMuons', (nAK8Jets, nMuons), ('nAK8', 'ntightMuons')),
-                ('nAK8vsnlooseMuons', (nAK8Jets, nLooseMuons), ('nAK8', 'nlooseMuons')),
-                ('nAK4vsntightLeptons', (nAK4Jets, nLeptons), ('nAK4', 'ntightLeptons')),
-                ('nAK4vsnlooseLeptons', (nAK4Jets, nLooseLeptons), ('nAK4', 'nlooseLeptons')),
-                ('nAK4vsntightElectrons', (nAK4Jets, nElectrons), ('nAK4', 'ntightElectrons')),
-                ('nAK4vsnlooseElectrons', (nAK4Jets, nLooseElectrons), ('nAK4', 'nlooseElectrons')),
-                ('nAK4vsntightMuons', (nAK4Jets, nMuons), ('nAK4', 'ntightMuons')),
-                ('nAK4vsnlooseMuons', (nAK4Jets, nLooseMuons), ('nAK4', 'nlooseMuons')),
-
-                ('nloosevsntightLeptons', (nLooseLeptons, nLeptons), ('nlooseLeptons', 'ntightLeptons')),
-                ]
-
+    def compute_kinematics(self, tightLeptons, looseLeptons, AK4Jets, AK8Jets, counts):
+        """
+        Build every derived quantity used by the selections and histograms once per chunk.
+        Regions only take masked slices of these arrays.
+        """
+        l1, l2 = tightLeptons[:, 0], tightLeptons[:, 1]
+        j1, j2 = AK4Jets[:, 0], AK4Jets[:, 1]
+        fj1 = AK8Jets[:, 0]
+        loose1 = looseLeptons[:, 0]
+
+        dilepton = l1 + l2
+        dijet = j1 + j2
+        threeobject_leadlep = l1 + dijet
+        threeobject_subleadlep = l2 + dijet
+        fourobject = dilepton + dijet
+        dilepton_boosted = l1 + loose1
+        twoobject = l1 + fj1
+
+        kinematics = {
+            'pt_leadlep':                  l1.pt,
+            'eta_leadlep':                 l1.eta,
+            'phi_leadlep':                 l1.phi,
+            'pt_subleadlep':               l2.pt,
+            'eta_subleadlep':              l2.eta,
+            'phi_subleadlep':              l2.phi,
+            'pt_leadjet':                  j1.pt,
+            'eta_leadjet':                 j1.eta,
+            'phi_leadjet':                 j1.phi,
+            'pt_subleadjet':               j2.pt,
+            'eta_subleadjet':              j2.eta,
+            'phi_subleadjet':              j2.phi,
+            'mass_dilepton':               dilepton.mass,
+            'pt_dilepton':                 dilepton.pt,
+            'mass_dijet':                  dijet.mass,
+            'pt_dijet':                    dijet.pt,
+            'mass_threeobject_leadlep':    threeobject_leadlep.mass,
+            'pt_threeobject_leadlep':      threeobject_leadlep.pt,
+            'mass_threeobject_subleadlep': threeobject_subleadlep.mass,
+            'pt_threeobject_subleadlep':   threeobject_subleadlep.pt,
+            'mass_fourobject':             fourobject.mass,
+            'pt_fourobject':               fourobject.pt,
+
+            # boosted
+            'pt_leadlooselep':             loose1.pt,
+            'eta_leadlooselep':            loose1.eta,
+            'phi_leadlooselep':            loose1.phi,
+            'pt_leadAK8Jets':              fj1.pt,
+            'eta_leadAK8Jets':             fj1.eta,
+            'phi_leadAK8Jets':             fj1.phi,
+            'LSF_leadingAK8Jets':          fj1.lsf3,
+            'mass_dilepton_boosted':       ak.fill_none(dilepton_boosted.mass, 0.0),
+            'pt_dilepton_boosted':         dilepton_boosted.pt,
+            'mass_twoobject':              twoobject.mass,
+            'pt_twoobject':                twoobject.pt,
+            'dPhi_leadTightlep_AK8Jets':   fj1.delta_phi(l1),
+
+            # object multiplicities
+            'count':                       np.ones(len(tightLeptons), dtype=np.float32),
+        }
+        kinematics.update(counts)
+
+        # Flat numpy arrays make the per-region slices plain fancy indexing; padded entries become NaN.
+        return {key: ak.to_numpy(ak.fill_none(vals, np.nan)) for key, vals in kinematics.items()}
+
+    def region_variables(self, region):
+        """Return the variable table filled in a given region."""
+        return FAMILY_VARIABLES[self._regions[region]["family"]]
+
+    @staticmethod
+    def sf_kinematics_key(variable):
+        """Map the reweighting variable (histogram or axis name) onto its kinematics key."""
+        for hist_name, key, axis_name in RESOLVED_VARIABLES:
+            if variable in (hist_name, axis_name):
+                return key
+        raise ValueError(f"Reweighting variable '{variable}' is not a resolved-region 1D variable.")
+
+    def dy_region_weights(self, regions, weight, kinematics):
+        """
+        Per-event DY correction factors, evaluated once per chunk and attached
+        to the resolved ee and mumu regions.
+        """
+        sf_vals = kinematics[self._sf_key]
+        weight_EE = weight * self.lookup_EE(sf_vals)
+        weight_MM = weight * self.lookup_MM(sf_vals)
+
+        region_weights = {}
+        for region in regions:
+            if region.startswith(("wr_ee_resolved_dy_cr", "wr_ee_resolved_sr")):
+                region_weights[region] = weight_EE
+            elif region.startswith(("wr_mumu_resolved_dy_cr", "wr_mumu_resolved_sr")):
+                region_weights[region] = weight_MM
+        return region_weights
+
+    def fill_histograms_batched(self, output, regions, process_name, kinematics, selection, is_data=False):
+        """
+        Fill all regions sharing a variable table with one fill call per histogram,
+        using a per-entry region label array for the region axis.
+        """
+        families = {}
+        for region in regions:
+            families.setdefault(self._regions[region]["family"], []).append(region)
+
+        for family_name, family in families.items():
+            variables = FAMILY_VARIABLES[family_name]
+            indices = [selection.indices(region) for region in family]
+            counts = [len(idx) for idx in indices]
+            if sum(counts) == 0:
+                continue
+
+            idx = np.concatenate(indices)
+            region_labels = np.repeat(np.array(family), counts)
+            w = np.concatenate([selection.region_weight(region) for region in family])
+
+            for hist_name, keys, axis_name in variables:
+                if isinstance(keys, tuple):  # 2D histogram
+                    fill_vals = {axis_name[0]: kinematics[keys[0]][idx], axis_name[1]: kinematics[keys[1]][idx]}
+                else:  # 1D histogram
+                    fill_vals = {axis_name: kinematics[keys][idx]}
+
+                self.fill_hist(
+                    output, hist_name, is_data, w,
+                    process=process_name,
+                    region=region_labels,
+                    **fill_vals
+                )
 
-            
-            # if 'v1' in region :
-            #      variables_2D = [
-            #          ('nAK8vsmlj', (nAK8Jets, (leptons[:, 0] + ak8jets[:, 0] ).mass), ('nAK8', 'mlj')),
-            #          ('nAK8vsmll', (nAK8Jets, (leptons[:, 0] + looseleptons[:, 0]).mass), ('nAK8', 'mll')),
+    def fill_basic_histograms(self, output, region, process_name, kinematics, selection, is_data=False):
+        variables = self.region_variables(region)
+        idx = selection.indices(region)
+        if len(idx) == 0:
+            return
+        w = selection.region_weight(region)
 
-            #          ('mllvsmlj', ((leptons[:, 0] + looseleptons[:, 0]).mass, (leptons[:, 0] + ak8jets[:, 0] ).mass), ('mll', 'mlj')),
-            # ]
-            
-            variables = variables_1D + variables_2D
-        else:
-            variables = [
-                ('pt_leading_lepton',         leptons[:, 0].pt,    'pt_leadlep'),
-                ('eta_leading_lepton',        leptons[:, 0].eta,   'eta_leadlep'),
-                ('phi_leading_lepton',        leptons[:, 0].phi,   'phi_leadlep'),
-                ('pt_leading_loose_lepton',      looseleptons[:, 0].pt,    'pt_leadlooselep'),
-                ('eta_leading_loose_lepton',     looseleptons[:, 0].eta,   'eta_leadlooselep'),
-                ('phi_leading_loose_lepton',     looseleptons[:, 0].phi,   'phi_leadlooselep'),
-                ('pt_leading_AK8Jets',            ak8jets[:, 0].pt,       'pt_leadAK8Jets'),
-                ('eta_leading_AK8Jets',           ak8jets[:, 0].eta,      'eta_leadAK8Jets'),
-                ('phi_leading_AK8Jets',           ak8jets[:, 0].phi,      'phi_leadAK8Jets'),
-                ('mass_dilepton',             mll_boosted, 'mass_dilepton'),
-                ('pt_dilepton',               (leptons[:, 0] + looseleptons[:, 0]).pt,   'pt_dilepton'),
-                ('mass_twoobject',           (leptons[:, 0] + ak8jets[:, 0] ).mass, 'mass_twoobject'),
-                ('pt_twoobject',             (leptons[:, 0] + ak8jets[:, 0]).pt,   'pt_twoobject'),
-                ('LSF_leading_AK8Jets', ak8jets[:,0].lsf3,'LSF_leadingAK8Jets'),
-                ('dPhi_leading_tightlepton_AK8Jet',  ak8jets[:, 0].delta_phi(leptons[:,0]),'dPhi_leadTightlep_AK8Jets')
-            ]
-
-        if self.variable is not None:
-            for _, vals_array, axis_name in variables:
-                if axis_name == self.variable:
-                    vals_all = vals_array
-                    break
-
-        # for hist_name, values, axis_name in variables:
-        #     vals = values[cut]
-        #     w = weights.weight()[cut]
-
-        #     if process_name == "DYJets" and self.lookup_EE is not None:
-        #         if region.startswith("wr_ee_resolved_dy_cr") or region.startswith("wr_ee_resolved_sr"):
-        #             corr = self.lookup_EE(vals_all[cut])
-        #         elif region.startswith("wr_mumu_resolved_dy_cr") or region.startswith("wr_mumu_resolved_sr"):
-        #             corr = self.lookup_MM(vals_all[cut])
-        #         else:
-        #             corr = 1.0
-        #         w = w * corr
-
-        #     output[hist_name].fill(
-        #         process=process_name,
-        #         region=region,
-        #         **{axis_name: vals},
-        #         weight=w
-        #     )
-        for var in variables:
-            hist_name = var[0]
-            vals = var[1]
-            axis_name = var[2]
-            
-            w = weights.weight()[cut]
-            
-            # Apply DY corrections if needed
-            if process_name == "DYJets" and self.lookup_EE is not None:
-                if region.startswith("wr_ee_resolved_dy_cr") or region.startswith("wr_ee_resolved_sr"):
-                    corr = self.lookup_EE(vals[cut] if isinstance(vals, ak.Array) else vals[0][cut])
-                elif region.startswith("wr_mumu_resolved_dy_cr") or region.startswith("wr_mumu_resolved_sr"):
-                    corr = self.lookup_MM(vals[cut] if isinstance(vals, ak.Array) else vals[0][cut])
-                else:
-                    corr = 1.0
-                w = w * corr
-                    
+        for hist_name, keys, axis_name in variables:
             # Fill 1D or 2D
-            if isinstance(vals, tuple):  # 2D histogram
-                output[hist_name].fill(
+            if isinstance(keys, tuple):  # 2D histogram
+                self.fill_hist(
+                    output, hist_name, is_data, w,
                     process=process_name,
                     region=region,
-                    **{axis_name[0]: vals[0][cut], axis_name[1]: vals[1][cut]},
-                    weight=w
+                    **{axis_name[0]: kinematics[keys[0]][idx], axis_name[1]: kinematics[keys[1]][idx]}
                 )
             else:  # 1D histogram
-                output[hist_name].fill(
+                self.fill_hist(
+                    output, hist_name, is_data, w,
                     process=process_name,
                     region=region,
-                    **{axis_name: vals[cut]},
-                    weight=w
+                    **{axis_name: kinematics[keys][idx]}
                 )
 
-
-            
     def process(self, events):
-        output = self.make_output()
+        output = {}
         metadata = events.metadata
+        # Per-stage wall time; with lazy reading, I/O is charged to the first stage touching a column
+        timer = StageTimer(self._profile_stages)
+        if self._preload:
+            events = self.preload_events(events)
+            timer.mark("preload")
 
         mc_campaign = metadata.get("era", "")
         process_name = metadata.get("physics_group", "")
@@ -375,11 +674,11 @@ class WrAnalysis(processor.ProcessorABC):
 #        logger.info(f"\n\nAnalyzing {len(events)} {dataset} events.\n\n")
 
         if isRealData:
-            if mc_campaign == "RunIISummer20UL18":
-                lumi_mask = LumiMask("data/lumis/RunII/2018/RunIISummer20UL18/Cert_314472-325175_13TeV_Legacy2018_Collisions18_JSON.txt")
-            elif mc_campaign in ("Run3Summer22", "Run3Summer22EE"):
-                lumi_mask = LumiMask("data/lumis/Run3/2022/Run3Summer22/Cert_Collisions2022_355100_362760_Golden.txt")
+            lumi_mask = self._lumi_masks.get(mc_campaign)
+            if lumi_mask is None:
+                lumi_mask = get_lumi_mask(mc_campaign)
             events = events[lumi_mask(events.run, events.luminosityBlock)]
+            timer.mark("lumi_mask")
 
         # if process_name == "Signal":
         #     self.check_mass_point_resolved()
@@ -427,6 +726,7 @@ class WrAnalysis(processor.ProcessorABC):
 
         AK8Jets = self.selectAK8Jets(events)
         nAK8Jets = ak.fill_none(ak.num(AK8Jets), 0)
+        timer.mark("object_selection")
 
         # Event variables
         tightLeptons_all = ak.with_name(ak.concatenate((tightElectrons, tightMuons), axis=1), 'PtEtaPhiMCandidate')
@@ -438,23 +738,17 @@ class WrAnalysis(processor.ProcessorABC):
         AK4Jets = ak.pad_none(AK4Jets, 2, axis=1)
         
         
-        mjj = ak.fill_none((AK4Jets[:, 0] + AK4Jets[:, 1]).mass, False)
-        
-        mll = ak.fill_none((tightLeptons[:, 0] + tightLeptons[:, 1]).mass, False)
-
-        mlljj = ak.fill_none((tightLeptons[:, 0] + tightLeptons[:, 1] + AK4Jets[:, 0] + AK4Jets[:, 1]).mass, False)
-
         dr_jl_min = ak.fill_none(ak.min(AK4Jets[:, :2].nearest(tightLeptons).delta_r(AK4Jets[:, :2]), axis=1), False)
         dr_j1j2 = ak.fill_none(AK4Jets[:, 0].delta_r(AK4Jets[:, 1]), False)
         dr_l1l2 = ak.fill_none(tightLeptons[:, 0].delta_r(tightLeptons[:, 1]), False)
 
         AK8Jets = AK8Jets[ak.argsort(AK8Jets.pt, axis=1, ascending=False)]
         AK8Jets = ak.pad_none(AK8Jets, 1, axis=1) 
-        dPhi_lj = ak.fill_none(AK8Jets[:, 0].delta_phi(tightLeptons[:,0]),0) 
         # ## adding for loose leptons                                                                                                          
         looseLeptons_all = ak.with_name(ak.concatenate((looseElectrons, looseMuons), axis=1), 'PtEtaPhiMCandidate')
         looseLeptons_all = looseLeptons_all[ak.argsort(looseLeptons_all.pt, axis=1, ascending=False)] #, 1, axis=1)
         looseLeptons = ak.pad_none(looseLeptons_all, 1, axis=1)
+        timer.mark("sort_and_pad")
         # All combinations of tight and loose leptons
         # shape: [events, n_tight, n_loose]
         # mll_all = (tightLeptons[:, :, None] + looseLeptons[:, None, :]).mass
@@ -479,8 +773,25 @@ class WrAnalysis(processor.ProcessorABC):
         # mlj_all = (tightLeptons[:, :, None] + AK8Jets[:, None, :]).mass
         # mlj_flat = ak.flatten(mlj_all, axis=1)
         # mlj_boosted = ak.max(mlj_flat, axis=(1,2))
-        mll_boosted =ak.fill_none((tightLeptons[:, 0] + looseLeptons[:, 0]).mass, 0.0)
-        mlj_boosted =ak.fill_none((tightLeptons[:, 0] +AK8Jets[:,0]).mass, 0.0)
+
+        # Derived kinematics, computed once and shared by every region
+        kinematics = self.compute_kinematics(tightLeptons, looseLeptons, AK4Jets, AK8Jets, {
+            'nAK8Jets':        nAK8Jets,
+            'nAK4Jets':        nAK4Jets,
+            'ntightLeptons':   nLeptons,
+            'nlooseLeptons':   nLooseLeptons,
+            'ntightElectrons': nTightElectrons,
+            'nlooseElectrons': nLooseElectrons,
+            'ntightMuons':     nTightMuons,
+            'nlooseMuons':     nLooseMuons,
+        })
+        timer.mark("kinematics")
+
+        mll = np.nan_to_num(kinematics['mass_dilepton'], nan=0.0)
+        mlljj = np.nan_to_num(kinematics['mass_fourobject'], nan=0.0)
+        mll_boosted = kinematics['mass_dilepton_boosted']
+        mlj_boosted = np.nan_to_num(kinematics['mass_twoobject'], nan=0.0)
+        dPhi_lj = np.nan_to_num(kinematics['dPhi_leadTightlep_AK8Jets'], nan=0.0)
         dR_ak8j_looselepton = ak.fill_none(ak.min(AK8Jets[:, 0:1].nearest(looseLeptons).delta_r(AK8Jets[:, 0:1]), axis=1), False)#ak.fill_none(AK8Jets[:, 0:1].delta_r(looseLeptons[:,0:1]), 999 ) #AK8Jets[:, 0:1].nearest(looseLeptons).delta_r(AK8Jets[:, 0:1]), 999 )
         #ak.fill_none(ak.min(AK8Jets[:, 0:1].nearest(looseLeptons).delta_r(AK8Jets[:, 0:1]), axis=1), False)
 
@@ -490,9 +801,10 @@ class WrAnalysis(processor.ProcessorABC):
         self.add_resolved_selections(selections, tightElectrons, tightMuons, AK4Jets, mlljj, dr_jl_min, dr_j1j2, dr_l1l2)
         self.add_boosted_selections(selections, tightElectrons, tightMuons, AK4Jets_notpadded,nAK8Jets, looseElectrons, looseMuons,dr_jl_min, dr_j1j2, dr_l1l2)
         # Trigger selections
-        if mc_campaign in ("RunIISummer20UL18", "Run2Autumn18"): 
-            eTrig = events.HLT.Ele32_WPTight_Gsf | events.HLT.Photon200 | events.HLT.Ele115_CaloIdVT_GsfTrkIdT
-            muTrig = events.HLT.Mu50 | events.HLT.OldMu100 | events.HLT.TkMu100
+        hlt_paths = get_hlt_paths(mc_campaign)
+        if mc_campaign in RUN2_ERAS:
+            eTrig = self.any_trigger(events, hlt_paths["e"])
+            muTrig = self.any_trigger(events, hlt_paths["mu"])
             selections.add("eeTrigger", (eTrig & (nTightElectrons == 2) & (nTightMuons == 0)))
             selections.add("mumuTrigger", (muTrig & (nTightElectrons == 0) & (nTightMuons == 2)))
             selections.add("emuTrigger", (eTrig & muTrig & (nTightElectrons == 1) & (nTightMuons == 1)))
@@ -501,9 +813,9 @@ class WrAnalysis(processor.ProcessorABC):
             # selections.add("emuTrigger_boosted",(eTrig  & (nTightElectrons == 1) & (nTightMuons == 0) & (nLooseMuons >= 1) & (nLooseElectrons == 0 ) & (dR_ak8j_looselepton < 0.8)))## add dR condition between loose and AK8 jets - come back to it again for 0.8 or 0.4 clarification
             # selections.add("mueTrigger_boosted",( muTrig & (nTightMuons == 1) & (nTightElectrons == 0) & (nLooseElectrons >= 1 ) & (nLooseMuons==0) & (dR_ak8j_looselepton < 0.8)))
             
-        elif mc_campaign in ("Run3Summer22", "Run3Summer23BPix", "Run3Summer22EE", "Run3Summer23"):
-            eTrig = events.HLT.Ele32_WPTight_Gsf | events.HLT.Photon200 | events.HLT.Ele115_CaloIdVT_GsfTrkIdT
-            muTrig = events.HLT.Mu50 | events.HLT.HighPtTkMu100
+        elif mc_campaign in RUN3_ERAS:
+            eTrig = self.any_trigger(events, hlt_paths["e"])
+            muTrig = self.any_trigger(events, hlt_paths["mu"])
             selections.add("eeTrigger", (eTrig & (nTightElectrons == 2) & (nTightMuons == 0)))
             selections.add("mumuTrigger", (muTrig & (nTightElectrons == 0) & (nTightMuons == 2)))
             selections.add("emuTrigger", ((eTrig | muTrig) & (nTightElectrons == 1) & (nTightMuons == 1)))
@@ -513,6 +825,7 @@ class WrAnalysis(processor.ProcessorABC):
             # selections.add("mueTrigger_boosted",(muTrig & (nTightMuons == 1) & (nTightElectrons == 0) & (nLooseElectrons >= 1) & (nLooseMuons==0) & (dR_ak8j_looselepton < 0.8 )))
 
         #selections.add("skim_select",(leading_lepton.pt > lead_pt_cut) & (subleading_lepton.pt > sublead_pt_cut))
+        timer.mark("selections")
 
         # Event Weights
         weights = Weights(len(events))
@@ -532,6 +845,7 @@ class WrAnalysis(processor.ProcessorABC):
 
         
         weights.add("event_weight", weight=eventWeight)
+        timer.mark("weights")
 
         selections.add("eejj", ((ak.num(tightElectrons) == 2) & (ak.num(tightMuons) == 0)))
         selections.add("mumujj", ((ak.num(tightElectrons) == 0) & (ak.num(tightMuons) == 2)))
@@ -555,118 +869,48 @@ class WrAnalysis(processor.ProcessorABC):
         selections.add("dPhi_lj>2.0",(dPhi_lj>2.0) | (dPhi_lj <-2.0))
         selections.add("atleast1tightLepton",(nLeptons>=0))
         #(nTighteptonsElectrons==1) & (nTightMuons==0))  | ((nTightElectrons==0) & (nTightMuons==1)))
-        # Define regions
-        regions = {
-            'wr_ee_resolved_dy_cr': ['twoTightLeptons', 'minTwoAK4Jets', 'leadTightLeptonPt60', 'eeTrigger' , 'mlljj>800', 'dr>0.4', '60mll150', 'eejj'],
-            'wr_mumu_resolved_dy_cr': ['twoTightLeptons', 'minTwoAK4Jets', 'leadTightLeptonPt60', 'mumuTrigger', 'mlljj>800', 'dr>0.4', '60mll150', 'mumujj'],
-            'wr_resolved_flavor_cr': ['twoTightLeptons', 'minTwoAK4Jets', 'leadTightLeptonPt60', 'emuTrigger', 'mlljj>800', 'dr>0.4', '400mll', 'emujj'],
-            'wr_ee_resolved_sr': ['twoTightLeptons', 'minTwoAK4Jets', 'leadTightLeptonPt60', 'eeTrigger', 'mlljj>800', 'dr>0.4', '400mll', 'eejj'],
-            'wr_mumu_resolved_sr': ['twoTightLeptons', 'minTwoAK4Jets', 'leadTightLeptonPt60', 'mumuTrigger', 'mlljj>800', 'dr>0.4', '400mll', 'mumujj'],
-
-            'wr_ee_boosted_sr' :['atleast1AK8Jets','leadTightLeptonPt60','atleast1LooseLepton'],#,'dPhi_lj>2.0'], #,'eeTrigger_boosted'], # '200mll_boosted','mlj>800','atleast1LooseLepton','eeTrigger_boosted','dPhi_lj>2.0'],
-#             # ['nottwoTightLeptons','atleast1AK8Jets','leadTightLeptonPt60', '200mll_boosted','mlj>800','atleast1LooseLepton','notminTwoAK4Jets','notdr>0.4','eeTrigger_boosted','dPhi_lj>2.0'], #'AK8Jets_LSF3>0.75','dPhi_lj>2.0'],
-#             'wr_ee_boosted_dy_cr' : ['notResolved','atleast1AK8Jets','leadTightLeptonPt60', 'atleast1LooseLepton'],#,'60mll_boosted150','mlj>800','ej'],#'dPhi_lj>2.0'],
-#             'wr_ee_boosted_dy_cr_mll' : ['notResolved','atleast1AK8Jets','leadTightLeptonPt60', 'atleast1LooseLepton', '60mll_boosted150'],
-#             'wr_ee_boosted_dy_cr_mlj' :	['notResolved','atleast1AK8Jets','leadTightLeptonPt60', 'atleast1LooseLepton', '60mll_boosted150','mlj>800'],
-#             'wr_ee_boosted_dy_cr_ee' : ['notResolved','atleast1AK8Jets','leadTightLeptonPt60', 'atleast1LooseLepton', '60mll_boosted150','mlj>800','ej'],
-#             'wr_ee_boosted_dy_cr_mumu' : ['notResolved','atleast1AK8Jets','leadTightLeptonPt60', 'atleast1LooseLepton', '60mll_boosted150','mlj>800','muj'],
-#             'wr_ee_boosted_dy_cr_emu' : ['notResolved','atleast1AK8Jets','leadTightLeptonPt60', 'atleast1LooseLepton', '60mll_boosted150','mlj>800','emuj'],
-
-#             #'60mll_boosted150','mlj>800','atleast1LooseLepton','eeTrigger_boosted','dPhi_lj>2.0'],
-# #['nottwoTightLeptons','atleast1AK8Jets','leadTightLeptonPt60', '60mll_boosted150','mlj>800','atleast1LooseLepton','notminTwoAK4Jets','notdr>0.4','eeTrigger_boosted','dPhi_lj>2.0'] , #,'AK8Jets_LSF3>0.75'],
-#             'wr_boosted_flavor_emu_cr' : ['notResolved','atleast1AK8Jets','leadTightLeptonPt60', 'atleast1LooseLepton', '200mll_boosted','mlj>800','emuj'],#,'dPhi_lj>2.0'], #'AK8Jets_LSF3>0.75', 'dPhi_lj>2.0','emuTrigger_boosted'],
-#             'wr_boosted_flavor_mue_cr' : ['notResolved','atleast1AK8Jets','leadTightLeptonPt60','atleast1LooseLepton','200mll_boosted','mlj>800','muej'],#Trigger_boosted', 'dPhi_lj>2.0'],#'AK8Jets_LSF3>0.75', 'dPhi_lj>2.0','mueTrigger_boosted'],
-#             'wr_mumu_boosted_sr' : ['notResolved','atleast1AK8Jets','leadTightLeptonPt60', 'atleast1LooseLepton','200mll_boosted','mlj>800','muj'],# 'dPhi_lj>2.0'],#'AK8Jets_LSF3>0.75','dPhi_lj>2.0'],
-#             'wr_mumu_boosted_dy_cr' : ['notResolved','atleast1AK8Jets','leadTightLeptonPt60','atleast1LooseLepton', '60mll_boosted150','mlj>800','muj'], #muTrigger_boosted','dPhi_lj>2.0'],#'AK8Jets_LSF3>0.75'],
-            
-            'wr_cross_check_region': ['atleast1tightLepton'],#atleast1AK8Jets'],
-            'wr_cross_check_region_withSkims' : ['atleast1AK8Jets','leadTightLeptonPt60'],
-            'wr_cross_check_region_withSkims_v1' : ['atleast1AK8Jets','leadTightLeptonPt60','mlj>800',],
-            'wr_cross_check_region_withSkims_v2' : ['atleast1AK8Jets','leadTightLeptonPt60','mlj>800','atleast1LooseLepton'],
-            'wr_cross_check_region_withSkims_v3' : ['atleast1AK8Jets','leadTightLeptonPt60','mlj>800','atleast1LooseLepton','200mll_boosted'],
-            'wr_cross_check_region_withSkims_v4' : ['atleast1AK8Jets','leadTightLeptonPt60','mlj>800','atleast1LooseLepton','200mll_boosted','dPhi_lj>2.0'],
-            'wr_cross_check_region_withSkims_v5' : ['atleast1AK8Jets','leadTightLeptonPt60','mlj>800','atleast1LooseLepton','200mll_boosted','dPhi_lj>2.0','atleast1tightLepton'],
-            'wr_cross_check_region_withSkims_v6' : ['atleast1AK8Jets','leadTightLeptonPt60','mlj>800','atleast1LooseLepton','200mll_boosted','dPhi_lj>2.0','atleast1tightLepton','notResolved'],
-            'wr_cross_check_region_withSkims_mu' : ['atleast1AK8Jets','leadTightLeptonPt60','mlj>800','atleast1LooseLepton','200mll_boosted','dPhi_lj>2.0','muj','notResolved'],
-            'wr_cross_check_region_withSkims_emu' : ['atleast1AK8Jets','leadTightLeptonPt60','mlj>800','atleast1LooseLepton','200mll_boosted','dPhi_lj>2.0','emuj','notResolved'],
-            'wr_cross_check_region_withSkims_mue' : ['atleast1AK8Jets','leadTightLeptonPt60','mlj>800','atleast1LooseLepton','200mll_boosted','dPhi_lj>2.0','muej','notResolved'],
-        }
         #print("Defined selections:", selections.names)
 
         # Helper: check if all cuts in regions exist in selections
-        cutflows = {}
-
         def check_missing_cuts(selections, regions):
             defined = set(selections.names)
-            for region, cuts in regions.items():
-                missing = [c for c in cuts if c not in defined]
+            for region, definition in regions.items():
+                missing = [c for c in definition["cuts"] if c not in defined]
                 if missing:
-                    print(f"Region '{region}' has missing selections: {missing}")
-
-        # output["cutflow"] = hist.Hist(
-        #     hist.axis.StrCategory([], name="cut", growth=True),
-        #     storage=hist.storage.Weight()
-        # )
-
-        for region, cuts in regions.items():
-            check_missing_cuts(selections, regions)
-            # for cut_name in cuts:
-            #     cut = selections.all(cut_name)  # Select events passing only this cut
-            #     hist_name = f"{region}__{cut_name}"  # Unique histogram name
-            #     self.fill_basic_histograms(
-            #         output, hist_name, cut, process_name,
-            #         AK4Jets, tightLeptons, AK8Jets, looseLeptons, weights
-            #     )
-            cut = selections.all(*cuts)
-            mask = np.ones(len(eventWeight), dtype=bool)
-            # n_events = len(tightLeptons)
-            # ones = ak.Array(np.ones(n_events, dtype=np.int32))
-            # ones = ak.fill_none(ones, 0)
-            # ones = ak.Array.to_numpy(ones,allow_missing=True) #awkward_array)
-            # tightLeptons is an awkward array per event
-            n_events = len(tightLeptons)
-            
-            # Make an array of ones for each event
-            ones = ak.Array(np.ones(n_events, dtype=np.float32))
-            
-            # If thereâs any chance of None, fill with 0
-            ones = ak.fill_none(ones, 0)
-            self.fill_basic_histograms(output, region, cut, process_name, AK4Jets, tightLeptons, AK8Jets, looseLeptons,ones, mll_boosted,nLeptons,nTightElectrons, nTightMuons, nLooseLeptons, nLooseElectrons, nLooseMuons, nAK8Jets, nAK4Jets, weights)
-            cf = {}
-            #mask = np.ones(len(eventWeight), dtype=bool)  # start with all events
-            i=0
-            for cut_name in cuts:
-                # i+=1
-                # mask = mask & selections.all(cut_name)  # apply one cut at a time
-                # cut_single = selections.all(cut_name)
-                #cf[cut_name] = np.sum(eventWeight[mask])  # weighted sum after this cut
-                # print(cut_name)
-                # hist_name = f"{region}__{cut_name}"    # Unique histogram name
-                mask = mask & selections.all(cut_name)
-                n_evt = np.sum(eventWeight[mask])
-                cf[cut_name] = np.sum(eventWeight[mask]) 
-                #output["cutflow"].fill(cut=f"{region}__{cut_name}", weight=n_evt)
-
-                # if "boosted" in region :
-                #     if i>5 :
-                #         self.fill_basic_histograms(
-                #         output, hist_name, cut_single, process_name,
-                #         AK4Jets, tightLeptons, AK8Jets, looseLeptons, weights
-                #     )
-            cutflows[region] = cf
-
-        # Pretty print
-        import pandas as pd
-        for region, cf in cutflows.items():
-            print(f"\nCutflow for {region}")
-            print(pd.DataFrame.from_dict(cf, orient="index", columns=["Weighted Events"]))
-            nested_output = {
-                dataset: {
-                    **output,
-                }
+                    logger.warning(f"Region '{region}' has missing selections: {missing}")
+
+        check_missing_cuts(selections, self._regions)
+
+        # Nominal weight evaluated once per chunk; regions get masked views of it
+        weight = weights.weight()
+        region_weights = {}
+        if process_name == "DYJets" and self.lookup_EE is not None:
+            region_weights = self.dy_region_weights(self._regions, weight, kinematics)
+        selection = RegionSelection(selections, weight, self._selection_tree, region_weights)
+        timer.mark("region_masks")
+
+        if self._batch_fill:
+            self.fill_histograms_batched(output, self._regions, process_name, kinematics, selection, isRealData)
+        else:
+            for region in self._regions:
+                self.fill_basic_histograms(output, region, process_name, kinematics, selection, isRealData)
+        timer.mark("histograms")
+
+        output["cutflow"] = {}
+        output["cutflow_unweighted"] = {}
+        self.fill_cutflows(output, process_name, selection)
+        timer.mark("cutflow")
+
+        if timer.enabled:
+            output["stage_timing"] = timer.timings
+
+        nested_output = {
+            dataset: {
+                **output,
             }
-        
+        }
+
         return nested_output
-            
+
     def postprocess(self, accumulator):
         return accumulator
@@ -0,0 +1,119 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import uuid
+from pathlib import Path
+
+from coffea import processor
+
+logger = logging.getLogger(__name__)
+
+
+def code_hash(paths, config=None):
+    """Hash of the analyzer source files and of its configuration; any change invalidates the cached chunks."""
+    digest = hashlib.sha256()
+    for path in sorted(str(p) for p in paths):
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    digest.update(json.dumps(config, sort_keys=True, default=str).encode())
+    return digest.hexdigest()[:16]
+
+
+def dataset_hashes(analyzer_hash, fileset):
+    """
+    Per-dataset extension of the analyzer hash with the dataset metadata (cross section,
+    sum of weights, data type, ...), which enters the weights of every chunk.
+    """
+    return {
+        dataset: code_hash([], config={"analyzer": analyzer_hash, "metadata": data["metadata"]})
+        for dataset, data in fileset.items()
+    }
+
+
+def chunk_key(fileuuid, entrystart, entrystop, analyzer_hash):
+    """Key of one chunk; fileuuid is either the raw bytes of a WorkItem or the string in events.metadata."""
+    if isinstance(fileuuid, (bytes, bytearray)):
+        fileuuid = str(uuid.UUID(bytes=bytes(fileuuid)))
+    return f"{fileuuid}_{entrystart}_{entrystop}_{analyzer_hash}"
+
+
+class ChunkStore:
+    """
+    Directory of pickled chunk outputs, one file per chunk key. Reads refresh the file's
+    mtime, and evict() removes the least recently used files once the store exceeds its
+    size budget; it scans the whole directory, so it is called once per run on the client
+    rather than on every write. The directory must be visible to the workers (local runs
+    or a shared filesystem).
+    """
+    def __init__(self, directory, max_bytes=20 * 1024**3):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+
+    def _path(self, key):
+        return self.directory / f"{key}.pkl"
+
+    def get(self, key):
+        """Return the cached output of a chunk, or None if it is not (or no longer) in the store."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                output = pickle.load(f)
+            os.utime(path)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        return output
+
+    def put(self, key, output):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(key)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as f:
+            pickle.dump(output, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def evict(self):
+        """Delete the least recently used entries until the store fits in its budget."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".pkl"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:  # removed by another worker
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+class CachingProcessor(processor.ProcessorABC):
+    """
+    Wrap a processor so every chunk output it produces is written to a ChunkStore.
+    Chunks already in the store are not dispatched at all (see bin/run_analysis.py).
+    """
+    def __init__(self, wrapped, store, analyzer_hashes):
+        self.wrapped = wrapped
+        self.store = store
+        self.analyzer_hashes = analyzer_hashes
+
+    def process(self, events):
+        output = self.wrapped.process(events)
+        metadata = events.metadata
+        key = chunk_key(metadata["fileuuid"], metadata["entrystart"], metadata["entrystop"], self.analyzer_hashes[metadata["dataset"]])
+        try:
+            self.store.put(key, output)
+        except OSError as e:
+            logger.warning(f"Could not cache chunk {key}: {e}")
+        return output
+
+    def postprocess(self, accumulator):
+        return self.wrapped.postprocess(accumulator)
@@ -0,0 +1,37 @@
+import os
+import socket
+import time
+
+from coffea import processor
+
+
+class MetricsProcessor(processor.ProcessorABC):
+    """
+    Wrap a processor and add one record per chunk (dataset, file, entry range, events,
+    processing time, worker) under the "chunk_metrics" key of the output. Records are
+    lists, so they are concatenated when the outputs are merged.
+    """
+    def __init__(self, wrapped):
+        self.wrapped = wrapped
+
+    def process(self, events):
+        start = time.time()
+        t0 = time.perf_counter()
+        output = self.wrapped.process(events)
+        seconds = time.perf_counter() - t0
+
+        metadata = events.metadata
+        record = {
+            "dataset": metadata["dataset"],
+            "filename": metadata["filename"],
+            "entrystart": metadata["entrystart"],
+            "entrystop": metadata["entrystop"],
+            "events": len(events),
+            "start": start,
+            "seconds": seconds,
+            "worker": f"{socket.gethostname()}:{os.getpid()}",
+        }
+        return {**output, "chunk_metrics": [record]}
+
+    def postprocess(self, accumulator):
+        return self.wrapped.postprocess(accumulator)
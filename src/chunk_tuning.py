@@ -0,0 +1,97 @@
+import logging
+import resource
+import threading
+import time
+
+from coffea import processor
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = resource.getpagesize()
+
+
+def current_rss():
+    """Resident set size of this process in bytes."""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * PAGE_SIZE
+
+
+def peak_rss():
+    """Peak resident set size of this process in bytes (ru_maxrss is in kB on Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class RssSampler:
+    """
+    Peak resident set size while the context is active, sampled every `interval` seconds
+    in a background thread. Unlike peak_rss, it is not the peak over the whole life of the
+    process, so it also holds in a worker that already processed other chunks.
+    """
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while True:
+            self.peak = max(self.peak, current_rss())
+            if self._stop.wait(self.interval):
+                return
+
+    def __enter__(self):
+        self.peak = current_rss()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+
+class CalibrationProcessor(processor.ProcessorABC):
+    """
+    Run the wrapped processor on a few calibration chunks and only return, per dataset,
+    the number of events, the processing time and the memory growth of every chunk
+    (sampled peak RSS during the chunk minus the RSS before it).
+    """
+    def __init__(self, wrapped):
+        self.wrapped = wrapped
+
+    def process(self, events):
+        rss_before = current_rss()
+        with RssSampler() as sampler:
+            start = time.perf_counter()
+            self.wrapped.process(events)
+            seconds = time.perf_counter() - start
+        memory = max(sampler.peak - rss_before, 0)
+
+        return {
+            "calibration": {
+                events.metadata["dataset"]: {"events": [len(events)], "seconds": [seconds], "memory": [memory]}
+            }
+        }
+
+    def postprocess(self, accumulator):
+        return accumulator
+
+
+def choose_chunksize(calibration, target_seconds, max_memory, min_chunksize=10_000, max_chunksize=2_000_000):
+    """
+    Chunk size that makes a task last about target_seconds while its memory growth stays
+    below max_memory bytes, from the event rate and memory per event of the calibration chunks.
+    Rounded to a multiple of min_chunksize.
+    """
+    events = sum(calibration["events"])
+    seconds = sum(calibration["seconds"])
+    if events == 0 or seconds <= 0:
+        return None
+
+    chunksize = target_seconds * events / seconds
+    memory_per_event = max(m / n for m, n in zip(calibration["memory"], calibration["events"]) if n > 0)
+    if memory_per_event > 0:
+        chunksize = min(chunksize, max_memory / memory_per_event)
+
+    chunksize = int(chunksize // min_chunksize) * min_chunksize
+    return max(min_chunksize, min(chunksize, max_chunksize))
@@ -0,0 +1,143 @@
+import pickle
+
+import hist
+import numpy as np
+from coffea import processor
+from coffea.processor import accumulate
+
+CODECS = ("none", "lz4", "zstd")
+
+# Output keys whose empty histograms are still sent: a region without events is written to the cutflow with zeros
+KEEP_EMPTY = ("cutflow", "cutflow_unweighted")
+
+
+def get_codec(codec):
+    """(compress, decompress) functions of a codec name in CODECS."""
+    if codec == "none":
+        return bytes, bytes
+    if codec == "lz4":
+        import lz4.frame
+        return lz4.frame.compress, lz4.frame.decompress
+    if codec == "zstd":
+        import cramjam
+        return (lambda data: bytes(cramjam.zstd.compress(data, level=3))), (lambda data: bytes(cramjam.zstd.decompress(data)))
+    raise ValueError(f"Unknown codec '{codec}', choose from {CODECS}")
+
+
+class _PackedHist:
+    """Axes and storage of a dense histogram; its bin contents travel as a separately compressed buffer."""
+    def __init__(self, h, index):
+        view = np.asarray(h.view(flow=True))
+        self.axes = tuple(h.axes)
+        self.storage = h.storage_type
+        self.attributes = {"name": h.name, "label": h.label, "metadata": h.metadata}
+        self.dtype = view.dtype
+        self.shape = view.shape
+        self.index = index
+
+    def unpack(self, buffers):
+        h = hist.Hist(*self.axes, storage=self.storage(), **self.attributes)
+        np.asarray(h.view(flow=True))[...] = np.frombuffer(buffers[self.index], dtype=self.dtype).reshape(self.shape)
+        return h
+
+
+def _pack(value, buffers, compress, stats, drop_empty=True):
+    if isinstance(value, dict):
+        packed = {}
+        for key, item in value.items():
+            item = _pack(item, buffers, compress, stats, drop_empty and key not in KEEP_EMPTY)
+            if item is not None:
+                packed[key] = item
+        return packed
+    if isinstance(value, hist.Hist):
+        raw = np.ascontiguousarray(np.asarray(value.view(flow=True))).tobytes()
+        if drop_empty and not np.frombuffer(raw, dtype=np.uint8).any():
+            stats["dropped"] += 1
+            return None
+        stats["raw_bytes"] += len(raw)
+        packed = _PackedHist(value, len(buffers))
+        buffers.append(compress(raw))
+        return packed
+    return value
+
+
+def _unpack(value, buffers):
+    if isinstance(value, dict):
+        return {key: _unpack(item, buffers) for key, item in value.items()}
+    if isinstance(value, _PackedHist):
+        return value.unpack(buffers)
+    return value
+
+
+class CompactOutput:
+    """
+    Chunk output that is compacted whenever it is pickled, i.e. when it is sent from a
+    worker to another worker or to the client: histograms without any filled bin are
+    dropped, except the cutflows (KEEP_EMPTY), and the flat bin buffers of the dense
+    histograms are compressed with the codec. Bin contents are copied byte for byte, so values are exact. Adding two
+    CompactOutputs merges their outputs and the transfer statistics of both.
+
+    Every output, a chunk output or a partial merge, is counted in the transfer statistics
+    only the first time it is pickled: Dask spilling it to disk or copying it to another
+    worker, or a deepcopy, pickles the same output again and would otherwise inflate them.
+    """
+    def __init__(self, output, codec="lz4", transfer=None):
+        self.output = output
+        self.codec = codec
+        self.transfer = transfer or {"messages": 0, "bytes": 0, "raw_bytes": 0, "dropped_histograms": 0}
+        self.counted = False
+
+    def __add__(self, other):
+        transfer = {key: self.transfer[key] + other.transfer[key] for key in self.transfer}
+        return CompactOutput(accumulate([self.output, other.output]), self.codec, transfer)
+
+    def __getstate__(self):
+        compress, _ = get_codec(self.codec)
+        buffers = []
+        stats = {"raw_bytes": 0, "dropped": 0}
+        skeleton = _pack(self.output, buffers, compress, stats)
+        payload = pickle.dumps((skeleton, buffers), protocol=pickle.HIGHEST_PROTOCOL)
+        # Statistics of this message, counted by the receiver unless this output was already sent
+        message = None
+        if not self.counted:
+            message = {"bytes": len(payload), "raw_bytes": stats["raw_bytes"], "dropped_histograms": stats["dropped"]}
+            self.counted = True
+        return {"codec": self.codec, "payload": payload, "transfer": self.transfer, "message": message}
+
+    def __setstate__(self, state):
+        _, decompress = get_codec(state["codec"])
+        skeleton, buffers = pickle.loads(state["payload"])
+        self.output = _unpack(skeleton, [decompress(buffer) for buffer in buffers])
+        self.codec = state["codec"]
+        self.counted = True
+        message = state["message"]
+        self.transfer = dict(state["transfer"])
+        if message is not None:
+            self.transfer["messages"] += 1
+            for key, value in message.items():
+                self.transfer[key] += value
+
+
+class CompactOutputProcessor(processor.ProcessorABC):
+    """
+    Wrap a processor so that its chunk outputs are sent as CompactOutput under the
+    "compact" key. Use unpack_output on the result of the Runner.
+    """
+    def __init__(self, wrapped, codec="lz4"):
+        get_codec(codec)  # fail on the client for an unknown codec
+        self.wrapped = wrapped
+        self.codec = codec
+
+    def process(self, events):
+        return {"compact": CompactOutput(self.wrapped.process(events), self.codec)}
+
+    def postprocess(self, accumulator):
+        return accumulator
+
+
+def unpack_output(output):
+    """Output and transfer statistics of a Runner result of a CompactOutputProcessor."""
+    compact = output.get("compact")
+    if compact is None:
+        return output, None
+    return compact.output, compact.transfer
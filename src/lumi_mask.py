@@ -0,0 +1,66 @@
+import json
+import logging
+import os
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+LUMI_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "lumis")
+
+# Golden JSON certification file per era
+GOLDEN_JSONS = {
+    "RunIISummer20UL18": os.path.join(LUMI_DIR, "RunII/2018/RunIISummer20UL18/Cert_314472-325175_13TeV_Legacy2018_Collisions18_JSON.txt"),
+    "Run3Summer22": os.path.join(LUMI_DIR, "Run3/2022/Run3Summer22/Cert_Collisions2022_355100_362760_Golden.txt"),
+    "Run3Summer22EE": os.path.join(LUMI_DIR, "Run3/2022/Run3Summer22/Cert_Collisions2022_355100_362760_Golden.txt"),
+}
+
+# Process-wide cache of parsed masks, keyed by era
+_LUMI_MASKS = {}
+
+
+class CompactLumiMask:
+    """
+    Golden JSON held as sorted arrays of lumi-section ranges, encoded as (run << 32) | lumi.
+    Certified ranges never overlap, so a lookup is a single vectorized binary search.
+    Small enough to be pickled with the processor and shipped to workers.
+    """
+    def __init__(self, starts, stops):
+        self.starts = starts
+        self.stops = stops
+
+    @classmethod
+    def from_json(cls, jsonfile):
+        with open(jsonfile) as f:
+            goldenjson = json.load(f)
+
+        starts, stops = [], []
+        for run, ranges in goldenjson.items():
+            for first, last in ranges:
+                starts.append((int(run) << 32) | int(first))
+                stops.append((int(run) << 32) | int(last))
+
+        starts = np.asarray(starts, dtype=np.int64)
+        stops = np.asarray(stops, dtype=np.int64)
+        order = np.argsort(starts)
+        return cls(starts[order], stops[order])
+
+    def __call__(self, runs, lumis):
+        keys = (np.asarray(runs, dtype=np.int64) << 32) | np.asarray(lumis, dtype=np.int64)
+        idx = np.searchsorted(self.starts, keys, side="right") - 1
+        return (idx >= 0) & (keys <= self.stops[np.maximum(idx, 0)])
+
+    def __len__(self):
+        return len(self.starts)
+
+
+def get_lumi_mask(era):
+    """
+    Return the lumi mask of an era, parsing its golden JSON only on first use in this process.
+    """
+    if era not in _LUMI_MASKS:
+        if era not in GOLDEN_JSONS:
+            raise ValueError(f"No golden JSON defined for era '{era}'")
+        _LUMI_MASKS[era] = CompactLumiMask.from_json(GOLDEN_JSONS[era])
+        logger.info(f"Loaded {len(_LUMI_MASKS[era])} certified lumi ranges for {era}")
+    return _LUMI_MASKS[era]
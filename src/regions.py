@@ -0,0 +1,77 @@
+import json
+import logging
+import os
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REGIONS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "regions.json")
+
+REGION_FAMILIES = ("resolved", "boosted", "check")
+
+
+def load_regions(path=DEFAULT_REGIONS_FILE):
+    """
+    Load the analysis regions from a JSON file of the form
+    {"region_name": {"family": "resolved", "cuts": ["cut1", "cut2", ...]}, ...}.
+    The family selects which set of histograms is filled in the region.
+    """
+    with open(path) as f:
+        regions = json.load(f)
+
+    for region, definition in regions.items():
+        if definition.get("family") not in REGION_FAMILIES:
+            raise ValueError(f"Region '{region}' has unknown family '{definition.get('family')}'. Choose from {REGION_FAMILIES}.")
+        if not definition.get("cuts"):
+            raise ValueError(f"Region '{region}' has no cuts.")
+
+    logger.info(f"Loaded {len(regions)} regions from {path}")
+    return regions
+
+
+class SelectionTree:
+    """
+    Region cut lists compiled into a prefix tree. Each node is the AND of the cuts on its
+    path from the root, so a prefix shared by several regions is evaluated exactly once
+    per chunk, and the node masks double as the cumulative cutflow of every region.
+    """
+    def __init__(self, regions):
+        self.parents = []  # parent node index, -1 for the root
+        self.cuts = []     # cut applied at this node
+        self.region_nodes = {}
+
+        children = {}
+        for region, cuts in regions.items():
+            node = -1
+            path = []
+            for cut in cuts:
+                key = (node, cut)
+                if key not in children:
+                    children[key] = len(self.cuts)
+                    self.parents.append(node)
+                    self.cuts.append(cut)
+                node = children[key]
+                path.append(node)
+            self.region_nodes[region] = path
+
+    def __len__(self):
+        return len(self.cuts)
+
+    def evaluate(self, selections):
+        """Return the mask of every node; parents are always created before their children."""
+        masks = []
+        for parent, cut in zip(self.parents, self.cuts):
+            mask = selections.all(cut)
+            if parent >= 0:
+                mask = masks[parent] & mask
+            masks.append(mask)
+        return masks
+
+    def node_sums(self, masks, weight):
+        """Weighted sum, sum of squared weights and raw count of the events in every node."""
+        weight2 = weight * weight
+        sumw = np.array([np.sum(weight, where=mask) for mask in masks])
+        sumw2 = np.array([np.sum(weight2, where=mask) for mask in masks])
+        raw = np.array([np.count_nonzero(mask) for mask in masks], dtype=np.int64)
+        return sumw, sumw2, raw
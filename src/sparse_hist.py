@@ -0,0 +1,138 @@
+import numpy as np
+import hist
+
+
+class SparseHist:
+    """
+    Histogram with the usual process/region category axes and one or more Regular axes,
+    storing only occupied bins. Each (process, region) pair keeps sorted flat bin indices
+    (flow bins included) with their sum of weights and, if weighted, sum of squared weights.
+    Filling and merging cost O(occupied bins); to_hist() densifies into a hist.Hist.
+    """
+    def __init__(self, axes, weighted=True):
+        # axes: list of (name, (nbins, start, stop), label)
+        self.axes = [(name, tuple(bins), label) for name, bins, label in axes]
+        self.weighted = weighted
+        self._bins = {}
+
+    @property
+    def shape(self):
+        """Shape of the dense value axes, flow bins included."""
+        return tuple(bins[0] + 2 for _, bins, _ in self.axes)
+
+    @staticmethod
+    def _bin_index(values, bins):
+        """Same binning as a boost-histogram Regular axis; index 0 is underflow, NaN goes to overflow."""
+        nbins, start, stop = bins
+        values = np.asarray(values, dtype=np.float64)
+        z = (values - start) / (stop - start)
+        with np.errstate(invalid="ignore"):
+            idx = np.floor(z * nbins)
+            idx = np.where(z < 0, -1, idx)
+            idx = np.where((z >= 1) | np.isnan(z), nbins, idx)
+        return idx.astype(np.int64) + 1
+
+    def _flat_index(self, values):
+        flat = None
+        for (name, bins, _), size in zip(self.axes, self.shape):
+            idx = self._bin_index(values[name], bins)
+            flat = idx if flat is None else flat * size + idx
+        return flat
+
+    @staticmethod
+    def _merge(entry, keys, sumw, sumw2):
+        if entry is not None:
+            keys = np.concatenate([entry[0], keys])
+            sumw = np.concatenate([entry[1], sumw])
+            sumw2 = None if sumw2 is None else np.concatenate([entry[2], sumw2])
+        keys, inverse = np.unique(keys, return_inverse=True)
+        sumw = np.bincount(inverse, weights=sumw, minlength=len(keys))
+        if sumw2 is not None:
+            sumw2 = np.bincount(inverse, weights=sumw2, minlength=len(keys))
+        return keys, sumw, sumw2
+
+    def fill(self, process, region, weight=None, **values):
+        flat = self._flat_index(values)
+        n = len(flat)
+        weight = np.ones(n) if weight is None else np.broadcast_to(np.asarray(weight, dtype=np.float64), (n,))
+
+        if n == 0:
+            return self
+
+        # Group the entries by (process, region) once, then fill each contiguous run of the
+        # stable sort; entries keep their order within a group, so the sums are unchanged
+        processes, process_index = np.unique(np.broadcast_to(np.asarray(process), (n,)), return_inverse=True)
+        regions, region_index = np.unique(np.broadcast_to(np.asarray(region), (n,)), return_inverse=True)
+        group = process_index.ravel() * len(regions) + region_index.ravel()
+        order = np.argsort(group, kind="stable")
+        group = group[order]
+        bounds = np.concatenate([np.flatnonzero(np.diff(group)) + 1, [n]])
+        start = 0
+        for stop in bounds:
+            sel = order[start:stop]
+            p, r = divmod(int(group[start]), len(regions))
+            w = weight[sel]
+            key = (str(processes[p]), str(regions[r]))
+            self._bins[key] = self._merge(self._bins.get(key), flat[sel], w, w * w if self.weighted else None)
+            start = stop
+        return self
+
+    def _check_compatible(self, other):
+        if not isinstance(other, SparseHist) or self.axes != other.axes:
+            raise ValueError("Cannot add SparseHist objects with different axes")
+
+    def promote(self):
+        """Weighted copy; unweighted histograms only hold unit-weight data, so sumw2 equals sumw."""
+        result = SparseHist(self.axes, weighted=True)
+        result._bins = {key: (keys, sumw, sumw if sumw2 is None else sumw2) for key, (keys, sumw, sumw2) in self._bins.items()}
+        return result
+
+    def __iadd__(self, other):
+        self._check_compatible(other)
+        if self.weighted and not other.weighted:
+            other = other.promote()
+        elif other.weighted and not self.weighted:
+            self.weighted = True
+            self._bins = self.promote()._bins
+        for key, (keys, sumw, sumw2) in other._bins.items():
+            self._bins[key] = self._merge(self._bins.get(key), keys, sumw, sumw2)
+        return self
+
+    def __add__(self, other):
+        self._check_compatible(other)
+        result = self.copy()
+        result += other
+        return result
+
+    def copy(self):
+        # Merged entries are always new arrays, so the per-bin arrays can be shared
+        result = SparseHist(self.axes, weighted=self.weighted)
+        result._bins = dict(self._bins)
+        return result
+
+    def __len__(self):
+        """Number of occupied bins."""
+        return sum(len(keys) for keys, _, _ in self._bins.values())
+
+    def to_hist(self):
+        """Densify into a hist.Hist with the same axes as create_hist/create_hist2D."""
+        processes = list(dict.fromkeys(p for p, _ in self._bins))
+        regions = list(dict.fromkeys(r for _, r in self._bins))
+
+        h = (
+            hist.Hist.new.StrCat(processes, name="process", label="Process", growth=True)
+            .StrCat(regions, name="region", label="Analysis Region", growth=True)
+        )
+        for name, bins, label in self.axes:
+            h = h.Reg(*bins, name=name, label=label)
+        h = h.Weight() if self.weighted else h.Double()
+
+        view = h.view(flow=True)
+        for (p, r), (keys, sumw, sumw2) in self._bins.items():
+            idx = (h.axes["process"].index(p), h.axes["region"].index(r)) + np.unravel_index(keys, self.shape)
+            if self.weighted:
+                view.value[idx] = sumw
+                view.variance[idx] = sumw2
+            else:
+                view[idx] = sumw
+        return h
@@ -0,0 +1,20 @@
+import time
+
+
+class StageTimer:
+    """
+    Wall time of the consecutive stages of WrAnalysis.process. Each mark(stage) charges the
+    time since the previous mark to that stage, so repeated stages accumulate. A disabled
+    timer returns immediately from mark() and reports nothing.
+    """
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.timings = {}
+        self._last = time.perf_counter() if enabled else None
+
+    def mark(self, stage):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.timings[stage] = self.timings.get(stage, 0.0) + (now - self._last)
+        self._last = now
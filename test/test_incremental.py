@@ -0,0 +1,56 @@
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from python.incremental import (
+    dataset_records, load_manifest, output_problems, record_chunks, record_datasets, record_outputs, save_manifest,
+)
+
+
+def write_outputs(directory):
+    root, cutflow = directory / "WRAnalyzer_DYJets.root", directory / "WRAnalyzer_DYJets_cutflow.json"
+    root.write_bytes(b"histograms")
+    cutflow.write_text("{}")
+    return [root, cutflow]
+
+
+def test_first_run_without_outputs_is_allowed(tmp_path):
+    manifest_path = tmp_path / "WRAnalyzer_DYJets_manifest.json"
+    outputs = [tmp_path / "WRAnalyzer_DYJets.root", tmp_path / "WRAnalyzer_DYJets_cutflow.json"]
+    assert output_problems(manifest_path, load_manifest(manifest_path), outputs) == []
+
+
+def test_outputs_without_manifest_are_refused(tmp_path):
+    outputs = write_outputs(tmp_path)
+    manifest_path = tmp_path / "WRAnalyzer_DYJets_manifest.json"
+    assert len(output_problems(manifest_path, load_manifest(manifest_path), outputs)) == 2
+
+
+def test_outputs_changed_after_the_manifest_are_refused(tmp_path):
+    outputs = write_outputs(tmp_path)
+    manifest_path = tmp_path / "WRAnalyzer_DYJets_manifest.json"
+    save_manifest(manifest_path, record_outputs({"files": {}}, outputs))
+    assert output_problems(manifest_path, load_manifest(manifest_path), outputs) == []
+
+    # Histograms rewritten, but the run stopped before saving the manifest
+    outputs[0].write_bytes(b"merged histograms")
+    assert len(output_problems(manifest_path, load_manifest(manifest_path), outputs)) == 1
+
+
+def test_changed_normalization_or_analyzer_is_refused(tmp_path):
+    outputs = write_outputs(tmp_path)
+    manifest_path = tmp_path / "WRAnalyzer_DYJets_manifest.json"
+    fileset = {"DYJets_HT100": {"files": {}, "metadata": {"xsec": 10.0, "nevts": 1000.0}}}
+    manifest = record_chunks({"files": {}}, [SimpleNamespace(filename="a.root", entrystart=0, entrystop=10)])
+    record_datasets(manifest, dataset_records(fileset, {"DYJets_HT100": "abc"}))
+    save_manifest(manifest_path, record_outputs(manifest, outputs))
+    manifest = load_manifest(manifest_path)
+
+    assert output_problems(manifest_path, manifest, outputs, dataset_records(fileset, {"DYJets_HT100": "abc"})) == []
+    assert len(output_problems(manifest_path, manifest, outputs, dataset_records(fileset, {"DYJets_HT100": "def"}))) == 1
+    fileset["DYJets_HT100"]["metadata"]["xsec"] = 12.0
+    assert len(output_problems(manifest_path, manifest, outputs, dataset_records(fileset, {"DYJets_HT100": "abc"}))) == 1
+    # A dataset the output does not contain yet is merged as new
+    assert output_problems(manifest_path, manifest, outputs, dataset_records({"DYJets_HT200": fileset["DYJets_HT100"]}, {"DYJets_HT200": "xyz"})) == []
@@ -0,0 +1,97 @@
+import sys
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from python.scaling import Autoscaler, ScalingPolicy, scheduler_backlog
+
+
+def make_policy():
+    return ScalingPolicy(min_workers=2, max_workers=50, target_seconds=600, backlog_per_worker=2)
+
+
+def test_grows_when_backlog_exceeds_twice_the_workers():
+    policy = make_policy()
+    # 100 tasks of 60 s need 10 workers to finish in 600 s
+    assert policy.desired(backlog=100, n_workers=4, seconds_per_chunk=60) == 10
+
+
+def test_does_not_grow_when_current_workers_meet_the_target():
+    policy = make_policy()
+    # Backlog above 2 per worker, but 10 workers already finish it in time
+    assert policy.desired(backlog=30, n_workers=10, seconds_per_chunk=60) == 10
+
+
+def test_keeps_workers_between_tail_and_threshold():
+    policy = make_policy()
+    assert policy.desired(backlog=15, n_workers=10, seconds_per_chunk=60) == 10
+
+
+def test_shrinks_in_the_tail():
+    policy = make_policy()
+    assert policy.desired(backlog=5, n_workers=10, seconds_per_chunk=60) == 5
+
+
+def test_clamps_to_min_and_max():
+    policy = make_policy()
+    assert policy.desired(backlog=0, n_workers=10, seconds_per_chunk=60) == 2
+    assert policy.desired(backlog=10_000, n_workers=10, seconds_per_chunk=60) == 50
+    assert policy.initial(n_chunks=1, seconds_per_chunk=1) == 2
+    assert policy.initial(n_chunks=10_000, seconds_per_chunk=600) == 50
+
+
+def test_preprocessing_uses_one_worker_per_file_up_to_the_limit():
+    policy = make_policy()
+    assert policy.preprocessing(5) == 5
+    assert policy.preprocessing(500) == 20
+    assert policy.preprocessing(0) == 2
+
+
+def test_scheduler_backlog_counts_unfinished_chunk_tasks():
+    processor = SimpleNamespace(state="memory", run_spec=None, dependencies=[])
+    states = ["queued", "processing", "memory", "waiting", "no-worker", "forgotten", "erred"]
+    chunks = [SimpleNamespace(state=state, run_spec="chunk", dependencies=[processor]) for state in states]
+    merge = SimpleNamespace(state="waiting", run_spec="merge", dependencies=chunks[:2])
+    scheduler = SimpleNamespace(tasks=dict(enumerate([processor, merge] + chunks)))
+    assert scheduler_backlog(scheduler) == 4
+
+
+release = threading.Event()
+
+def hold_chunk(i):
+    release.wait(60)
+    return i
+
+def merge(outputs):
+    return sum(outputs)
+
+
+def test_autoscaler_steps_on_a_local_cluster():
+    distributed = pytest.importorskip("distributed")
+    policy = ScalingPolicy(min_workers=1, max_workers=4, target_seconds=60, backlog_per_worker=2)
+    release.clear()
+    with distributed.LocalCluster(n_workers=1, threads_per_worker=1, processes=False, dashboard_address=None) as cluster, \
+            distributed.Client(cluster) as client:
+        autoscaler = Autoscaler(cluster, client, policy, seconds_per_chunk=60)
+        chunks = client.map(hold_chunk, range(20), pure=False)
+        total = client.submit(merge, chunks)
+        # Submission is asynchronous: wait until the scheduler knows every task
+        deadline = time.monotonic() + 30
+        while client.run_on_scheduler(lambda dask_scheduler: len(dask_scheduler.tasks)) < 21 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        try:
+            # 20 chunks of 60 s need 20 workers for 60 s, clamped to 4; the merge task is not backlog
+            assert autoscaler.step(None, elapsed=0) == (20, 1, 4)
+            client.wait_for_workers(4, timeout=30)
+        finally:
+            release.set()
+        assert total.result(timeout=30) == sum(range(20))
+
+        # All 20 chunks finished in 10 s on 4 workers: 2 s per chunk, smoothed into the 60 s estimate
+        assert autoscaler.step(20, elapsed=10) == (0, 4, 1)
+        assert autoscaler.seconds_per_chunk == pytest.approx(60 + 0.3 * (2 - 60))